@@ -1,5 +1,11 @@
 import os
 
+from histogram import LatencyHistogram, read_histograms
+import timeline
+
+# Percentiles of the merged latency histograms written to percentiles.csv
+PERCENTILES = [50, 95, 99]
+
 
 def write_throughput_all_experiments(all_experiments_metrics):
     with open(f'throughput.csv', 'w') as f:
@@ -71,6 +77,60 @@ def write_aggregate_metrics(experiment_folders):
     write_all_metrics_all_experiments(all_experiments_metrics)
 
 
+# Merges the latency histograms saved by every client ({i}.hist) into histograms of the whole experiment per
+# transaction type, so the percentiles are those of all transactions rather than an average of client percentiles.
+# Memory does not grow with the number of clients or transactions as histograms have a fixed number of buckets.
+def write_global_percentiles(experiment_folders):
+    with open('percentiles.csv', 'w') as w:
+        w.write('experiment_number,transaction_type,count,mean,{},max\n'.format(
+            ','.join('p{}'.format(p) for p in PERCENTILES)))
+        for index, folder in enumerate(experiment_folders, 5):
+            merged = {}
+            for file in sorted(os.listdir(folder)):
+                if file.endswith('.hist'):
+                    for transaction_type, histogram in read_histograms(f'{folder}/{file}').items():
+                        merged.setdefault(transaction_type, LatencyHistogram()).merge(histogram)
+            overall = LatencyHistogram()
+            for histogram in merged.values():
+                overall.merge(histogram)
+            merged['all'] = overall
+
+            for transaction_type, histogram in sorted(merged.items()):
+                if histogram.count == 0:
+                    continue
+                values = [histogram.mean()] + [histogram.percentile(p) for p in PERCENTILES] + [histogram.max]
+                w.write('{},{},{},{}\n'.format(index, transaction_type, histogram.count,
+                                               ','.join("{:.2f}".format(x) for x in values)))
+
+
+# Adds up the per-second counters saved by every client ({i}.timeline) of each experiment, giving the throughput
+# of the whole cluster over time. Seconds are relative to the first second in which a client of the experiment
+# committed a transaction, and clients is the number of clients that committed in that second.
+def write_throughput_timeline(experiment_folders):
+    with open('timeline.csv', 'w') as w:
+        w.write('experiment_number,second,clients,' + ','.join(timeline.COLUMNS) + '\n')
+        for index, folder in enumerate(experiment_folders, 5):
+            merged = {}
+            clients = {}
+            for file in sorted(os.listdir(folder)):
+                if file.endswith('.timeline'):
+                    for second, window in timeline.read_timeline(f'{folder}/{file}').items():
+                        if second in merged:
+                            merged[second] = [sum(tup) for tup in zip(merged[second], window)]
+                        else:
+                            merged[second] = window
+                        clients[second] = clients.get(second, 0) + 1
+            if not merged:
+                continue
+
+            first_second = min(merged)
+            for second in range(first_second, max(merged) + 1):
+                window = merged.get(second, [0] * (len(timeline.COLUMNS) - 1))
+                result = [index, second - first_second, clients.get(second, 0), second] + window
+                w.write(','.join(str(x) for x in result))
+                w.write('\n')
+
+
 def write_clients_csv(experiment_folders, nc_per_folder):
     with open('clients.csv', 'w') as w:
         for index, folder in enumerate(experiment_folders):
@@ -100,6 +160,12 @@ def main():
     # We use this to write the metrics per client, as specified in the project brief.
     write_clients_csv(experiment_folders, nc_by_folder)
 
+    # We use this to compute latency percentiles over all clients of each experiment.
+    # write_global_percentiles(experiment_folders)
+
+    # We use this to see the throughput of the cluster over the course of each experiment.
+    # write_throughput_timeline(experiment_folders)
+
 
 if __name__ == '__main__':
     main()
@@ -1,13 +1,22 @@
-import math
+import asyncio
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta, datetime
+from histogram import LatencyHistogram, merge_histograms, write_histograms
+import statements
 import transaction
 import argparse
 import psycopg2
 from psycopg2.errors import SerializationFailure
 import random
+import refcache
+import routing
 import time
+import timeline
+import tracing
 import os
+import output
+import pool
 
 TXN_ID = {
     "NEW_ORDER": "N",
@@ -21,106 +30,313 @@ TXN_ID = {
 }
 
 
-def get_percentile(data, percentile):
-    size = len(data)
-    return data[int(math.ceil((size * percentile) / 100)) - 1]
-
-
 class MetricsManager:
     def __init__(self):
-        # Keeps track of time taken for each transaction in milliseconds
-        self.transaction_timings = []
+        # Keeps track of time taken for each transaction in milliseconds, per transaction type
+        self.histograms = {}
+        # Commits, retries and latencies per second of the run
+        self.timeline = timeline.ThroughputTimeline()
         self.total_time = timedelta(0)
 
-    # Takes in a timedelta for a transaction
-    def add(self, delta):
-        self.transaction_timings.append(delta / timedelta(milliseconds=1))
+    # Takes in a timedelta for a transaction, the name of its type and the number of retries it needed
+    def add(self, delta, transaction_type, retries=0):
+        if transaction_type not in self.histograms:
+            self.histograms[transaction_type] = LatencyHistogram()
+        latency_ms = delta / timedelta(milliseconds=1)
+        self.histograms[transaction_type].record(latency_ms)
+        self.timeline.record(latency_ms, retries)
 
     def add_total_time(self, delta):
         self.total_time = delta
 
+    def overall_histogram(self):
+        return merge_histograms(self.histograms.values())
+
     def output_metrics(self):
-        total_transactions = len(self.transaction_timings)
-        sorted_transaction_timings = sorted(self.transaction_timings)
-        total_transaction_timings = sum(sorted_transaction_timings)
+        histogram = self.overall_histogram()
+        total_transactions = histogram.count
         sys.stderr.write("Number of executed transactions: {}\n".format(total_transactions))
         sys.stderr.write("Total transaction execution time (in seconds): {}\n".format(self.total_time.total_seconds()))
         sys.stderr.write(
             "Transaction throughput (transactions / s): {}\n".format(
                 total_transactions / (self.total_time.total_seconds())))
         sys.stderr.write(
-            "Average transaction latency (in milliseconds): {}\n".format(
-                total_transaction_timings / total_transactions))
+            "Average transaction latency (in milliseconds): {}\n".format(histogram.mean()))
         sys.stderr.write(
-            "Median transaction latency (in milliseconds): {}\n".format(get_percentile(sorted_transaction_timings, 50)))
+            "Median transaction latency (in milliseconds): {}\n".format(histogram.percentile(50)))
         sys.stderr.write("95th percentile transaction latency (in milliseconds): {}\n".format(
-            get_percentile(sorted_transaction_timings, 95)))
+            histogram.percentile(95)))
         sys.stderr.write("99th percentile transaction latency (in milliseconds): {}\n".format(
-            get_percentile(sorted_transaction_timings, 99)))
+            histogram.percentile(99)))
+
+        # Breakdown by transaction type
+        for transaction_type, histogram in sorted(self.histograms.items()):
+            sys.stderr.write(
+                "{}: {} transactions, latency (in milliseconds) avg {:.2f}, p50 {:.2f}, p95 {:.2f}, p99 {:.2f}, "
+                "max {:.2f}\n".format(transaction_type, histogram.count, histogram.mean(), histogram.percentile(50),
+                                      histogram.percentile(95), histogram.percentile(99), histogram.max))
 
     def write_metrics(self, filename):
         metrics = []
-        total_transactions = len(self.transaction_timings)
-        sorted_transaction_timings = sorted(self.transaction_timings)
-        total_transaction_timings = sum(sorted_transaction_timings)
+        histogram = self.overall_histogram()
+        total_transactions = histogram.count
         metrics.append(str(total_transactions))
         metrics.append(str(self.total_time.total_seconds()))
         metrics.append(str(total_transactions / (self.total_time.total_seconds())))
-        metrics.append(str(total_transaction_timings / total_transactions))
-        metrics.append(str(get_percentile(sorted_transaction_timings, 50)))
-        metrics.append(str(get_percentile(sorted_transaction_timings, 95)))
-        metrics.append(str(get_percentile(sorted_transaction_timings, 99)))
+        metrics.append(str(histogram.mean()))
+        metrics.append(str(histogram.percentile(50)))
+        metrics.append(str(histogram.percentile(95)))
+        metrics.append(str(histogram.percentile(99)))
         with open(filename, "w") as f:
             f.write(",".join(metrics))
 
+    # Latency histograms per transaction type, which can be merged across clients
+    def write_histograms(self, filename):
+        write_histograms(self.histograms, filename)
 
+    def write_timeline(self, filename):
+        self.timeline.write(filename)
+
+
+# Lazily parses the transaction file, constructing each transaction only when it is requested
+# so that execution can start immediately and memory use does not depend on the size of the file
 def setup_transactions(file, conn):
-    transactions = []
-    line = file.readline()
-    while line:
-        args = line.rstrip('\n').split(',')
+    for line in file:
+        args = line.rstrip('\r\n').split(',')
         identifier = args[0]
         if identifier == TXN_ID["NEW_ORDER"]:
             inputs = args[1:]
             # Adds each item as a nested list
             num_items = int(args[-1])
             for i in range(0, num_items):
-                item_line = file.readline()
-                inputs.append(item_line.rstrip('\n').split(','))
-            transactions.append(transaction.NewOrderTransaction(conn, inputs))
+                item_line = next(file, None)
+                # The file ended before all the items of the New-Order
+                if item_line is None:
+                    print("UNABLE TO PARSE XACT INPUT: ", args, file=sys.stderr)
+                    return
+                inputs.append(item_line.rstrip('\r\n').split(','))
+            yield transaction.NewOrderTransaction(conn, inputs)
         elif identifier == TXN_ID["PAYMENT"]:
-            transactions.append(transaction.PaymentTransaction(conn, args[1:]))
+            yield transaction.PaymentTransaction(conn, args[1:])
         elif identifier == TXN_ID["DELIVERY"]:
-            transactions.append(transaction.DeliveryTransaction(conn, args[1:]))
+            yield transaction.DeliveryTransaction(conn, args[1:])
         elif identifier == TXN_ID["ORDER_STATUS"]:
-            transactions.append(transaction.OrderStatusTransaction(conn, args[1:]))
+            yield transaction.OrderStatusTransaction(conn, args[1:])
         elif identifier == TXN_ID["STOCK_LEVEL"]:
-            transactions.append(transaction.StockLevelTransaction(conn, args[1:]))
+            yield transaction.StockLevelTransaction(conn, args[1:])
         elif identifier == TXN_ID["POPULAR_ITEM"]:
-            transactions.append(transaction.PopularItemTransaction(conn, args[1:]))
+            yield transaction.PopularItemTransaction(conn, args[1:])
         elif identifier == TXN_ID["TOP_BALANCE"]:
-            transactions.append(transaction.TopBalanceTransaction(conn, args[1:]))
+            yield transaction.TopBalanceTransaction(conn, args[1:])
         elif identifier == TXN_ID["RELATED_CUSTOMER"]:
-            transactions.append(transaction.RelatedCustomerTransaction(conn, args[1:]))
+            yield transaction.RelatedCustomerTransaction(conn, args[1:])
         else:
-            print("UNABLE TO PARSE XACT INPUT: ", args)
+            print("UNABLE TO PARSE XACT INPUT: ", args, file=sys.stderr)
+
+
+# Runs the transaction until it commits, retrying with exponential backoff on serialization failures
+# Returns the number of retries needed
+def execute_transaction(txn):
+    retry_count = 0
+    last_error = ""
+    while True:
+        try:
+            tracing.begin_attempt(txn.__class__.__name__, retry_count)
+            txn.run()
+            # Flag issue if transactions had retried more than 15 times (sleep time > 5 seconds)
+            if retry_count > 10:
+                sys.stderr.write("Transaction of type " + txn.__class__.__name__ + " retried: " + str(retry_count)
+                                 + " times before completion with error: " + last_error + " \n")
+            return retry_count
+        except SerializationFailure as e:
+            sleep_ms = (2 ** (retry_count % 16)) * 0.1 * (random.random() + 0.5)
+            time.sleep(sleep_ms / 1000)
+            last_error = str(e)
+            retry_count += 1
+            continue
+
+
+# SQLSTATE codes on which CockroachDB transactions can be retried: serialization failures (including
+# restart requests)
+RETRYABLE_PGCODES = {"40001"}
+
+# SQLSTATE code of statement completion unknown: the transaction may have committed, so it is only retried
+# if it does not write
+AMBIGUOUS_RESULT_PGCODE = "40003"
+
+
+# Runs the transaction using CockroachDB's client-side retry protocol: on a retryable error the transaction
+# rolls back to the cockroach_restart savepoint and reruns its statements immediately, keeping its timestamp
+# and priority. Transactions that cannot use a savepoint, or that cannot be rolled back to it (e.g. after an
+# ambiguous commit of a read-only transaction), are begun anew.
+# Returns the number of retries needed
+def execute_transaction_with_savepoint(txn):
+    if not txn.savepoint_retry:
+        return execute_transaction(txn)
+
+    retry_count = 0
+    last_error = ""
+    committed = False
+    while not committed:
+        with txn.conn:
+            with txn.conn.cursor() as curs:
+                curs.execute("SAVEPOINT cockroach_restart")
+                while True:
+                    try:
+                        tracing.begin_attempt(txn.__class__.__name__, retry_count)
+                        txn.execute(curs)
+                        curs.execute("RELEASE SAVEPOINT cockroach_restart")
+                        committed = True
+                        break
+                    except psycopg2.Error as e:
+                        if e.pgcode == AMBIGUOUS_RESULT_PGCODE and not txn.read_only:
+                            sys.stderr.write("Result of transaction of type " + txn.__class__.__name__
+                                             + " is unknown, not retrying it as it may have committed: "
+                                             + str(e) + " \n")
+                            raise
+                        if e.pgcode not in RETRYABLE_PGCODES and e.pgcode != AMBIGUOUS_RESULT_PGCODE:
+                            raise
+                        last_error = str(e)
+                        retry_count += 1
+
+                    try:
+                        curs.execute("ROLLBACK TO SAVEPOINT cockroach_restart")
+                    except psycopg2.Error:
+                        txn.conn.rollback()
+                        break
+
+    if retry_count > 10:
+        sys.stderr.write("Transaction of type " + txn.__class__.__name__ + " retried: " + str(retry_count)
+                         + " times before completion with error: " + last_error + " \n")
+    return retry_count
 
-        line = file.readline()
 
-    return transactions
+# Retry strategies, selected with --retryMode
+RETRY_MODES = {
+    "backoff": execute_transaction,
+    "savepoint": execute_transaction_with_savepoint,
+}
+
+
+# Runs the transaction on the connection to the best node of the pool, moving on to another node
+# if the connection fails
+# Returns the number of retries needed
+def run_on_pool(node_pool, txn, execute_fn):
+    while True:
+        node, txn.conn = node_pool.acquire(getattr(txn, "warehouse_id", None))
+        try:
+            retry_count = execute_fn(txn)
+        except psycopg2.Error as e:
+            if not pool.is_connection_error(e):
+                raise
+            sys.stderr.write("Connection to {} failed, retrying transaction of type {} on another node: {}\n".format(
+                node, txn.__class__.__name__, e))
+            node_pool.report_failure(node)
+            continue
+        node_pool.report_success(node)
+        return retry_count
+
+
+# Async driver which gives each session its own pool of blocking psycopg2 connections and a dedicated worker
+# thread. The transaction implementations are written against the blocking DB-API, so a session's statements
+# run on its thread while the event loop interleaves the sessions.
+class ThreadedSessionDriver:
+    def __init__(self, pool_fn, execute_fn):
+        self.node_pool = pool_fn()
+        self.execute_fn = execute_fn
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.closed = False
+
+    async def open(self):
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(self.executor, self.node_pool.acquire)
+
+    async def execute(self, txn):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.executor, run_on_pool, self.node_pool, txn, self.execute_fn)
+
+    # Can be called more than once, only the first call closes the pool
+    async def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        loop = asyncio.get_event_loop()
+        try:
+            await loop.run_in_executor(self.executor, self.node_pool.close)
+        finally:
+            self.executor.shutdown()
+
+
+# Drivers available to the async execution mode, selected with --driver
+ASYNC_DRIVERS = {
+    "threaded": ThreadedSessionDriver,
+}
+
+
+def read_transactions(filename, conn):
+    with open(filename, 'r') as f:
+        yield from setup_transactions(f, conn)
+
+
+# Transactions are given a connection by the session's pool when they run
+async def open_session(driver, filename):
+    await driver.open()
+    return read_transactions(filename, None)
+
+
+async def run_session(driver, transactions, metrics, sink):
+    for txn in transactions:
+        transaction_start = datetime.now()
+        retries = await driver.execute(txn)
+        transaction_end = datetime.now()
+        metrics.add(transaction_end - transaction_start, txn.__class__.__name__, retries)
+
+        sink.write(txn.__class__.__name__, txn.outputs)
+    await driver.close()
+
+
+# Runs num_sessions concurrent sessions in a single process, assigning transaction files to sessions round robin.
+# If a session fails, the other sessions are cancelled and the drivers of all sessions are closed.
+async def run_sessions(filenames, num_sessions, driver_cls, pool_fn, execute_fn, metrics, sink, start_at=None):
+    drivers = []
+    tasks = []
+    try:
+        for _ in range(num_sessions):
+            drivers.append(driver_cls(pool_fn, execute_fn))
+        tasks = [asyncio.ensure_future(open_session(driver, filenames[i % len(filenames)]))
+                 for i, driver in enumerate(drivers)]
+        sessions = await asyncio.gather(*tasks)
+        if start_at is not None:
+            await asyncio.sleep(max(start_at - time.time(), 0))
+
+        total_execution_start = datetime.now()
+        tasks = [asyncio.ensure_future(run_session(driver, transactions, metrics, sink))
+                 for driver, transactions in zip(drivers, sessions)]
+        await asyncio.gather(*tasks)
+        total_execution_end = datetime.now()
+        metrics.add_total_time(total_execution_end - total_execution_start)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # Errors closing the other sessions would hide the error that ended the run
+        await asyncio.gather(*[driver.close() for driver in drivers], return_exceptions=True)
 
 
 def main():
-    # Usage: python3 client.py <file> <hostNum> <db>
+    # Usage: python3 client.py <file> [<file> ...] <hostNum> [<hostNum> ...] <db> [-s <sessions>]
     # Example: python3 client.py 1.txt -hn 2
+    # Example: python3 client.py 1.txt -hn 0 1 2 3 4 (run on the best of xcnc0 to xcnc4)
+    # Example: python3 client.py 1.txt 2.txt -hn 2 -s 8 (8 concurrent sessions over 1.txt and 2.txt)
     # if hostNum not specified, use default host 2 (i.e. xcnc2)
     parser = argparse.ArgumentParser()
     parser.add_argument("file", metavar="F",
-                        type=argparse.FileType('r'),
-                        help='Transaction file for client')
+                        type=argparse.FileType('r'), nargs='+',
+                        help='Transaction file(s) for client. Multiple files require --sessions.')
     parser.add_argument("-hn", '--hostNum',
-                        type=int, default=2,
-                        help='Host number e.g. 2 for xcnc2. Default is xcnc2.'
+                        type=int, nargs='+', default=[2],
+                        help='Host number(s) e.g. 2 for xcnc2. Transactions are sent to the healthy host with the '
+                             'lowest round trip time. Default is xcnc2.'
                         )
     parser.add_argument("-p", '--port',
                         type=int, default=26260,
@@ -130,51 +346,150 @@ def main():
                         type=str, default="project",
                         help='Database name'
                         )
+    parser.add_argument("-s", '--sessions',
+                        type=int, default=0,
+                        help='Number of concurrent sessions to run in async mode. '
+                             'Files are assigned to sessions round robin. Default is 0 (synchronous, single session).'
+                        )
+    parser.add_argument("--driver",
+                        choices=sorted(ASYNC_DRIVERS), default="threaded",
+                        help='Driver used by async mode. threaded runs each session on an OS thread and a connection pool '
+                             'of its own, so -s N costs N threads and N x (number of hosts) connections. '
+                             'Default is threaded.'
+                        )
+    parser.add_argument("-ps", '--preparedStatements',
+                        type=int, default=0,
+                        help='Maximum number of server-side prepared statements cached per connection. '
+                             'Default is 0 (statements are sent as text).'
+                        )
+    parser.add_argument("-rc", '--referenceCache',
+                        choices=refcache.CACHE_MODES, default="lazy",
+                        help='Client-side cache of item and warehouse tax data: off, lazy (filled on first read) '
+                             'or preload (bulk loaded before execution). Default is lazy.'
+                        )
+    parser.add_argument("-rcs", '--referenceCacheSize',
+                        type=int, default=200000,
+                        help='Maximum number of rows held by the reference cache. Default is 200000.'
+                        )
+    parser.add_argument("-r", '--routing',
+                        choices=["latency", "leaseholder"], default="latency",
+                        help='How a host is chosen for each transaction: latency (fastest healthy host) or '
+                             'leaseholder (host holding the lease on the warehouse of the transaction, if healthy). '
+                             'Default is latency.'
+                        )
+    parser.add_argument("--routingTable",
+                        type=str, default="district",
+                        help='Table whose range leases are used by leaseholder routing. It must be split by warehouse, '
+                             'as done by setup.py -l parallel, otherwise transactions are routed by latency. '
+                             'Default is district.'
+                        )
+    parser.add_argument("--routingRefresh",
+                        type=float, default=60.0,
+                        help='Seconds between refreshes of the leaseholder map. Default is 60.'
+                        )
+    parser.add_argument("-rm", '--retryMode',
+                        choices=sorted(RETRY_MODES), default="backoff",
+                        help='How transactions are retried on serialization failures: backoff (rerun in a new '
+                             'transaction after an exponential backoff sleep) or savepoint (restart from the '
+                             'cockroach_restart savepoint). Default is backoff.'
+                        )
+    parser.add_argument("-o", '--output',
+                        choices=output.SINK_TYPES, default="text",
+                        help='How transaction outputs are written to stdout: text (as each transaction completes), '
+                             'buffered (text, by a background writer), jsonl (JSON Lines, by a background writer) '
+                             'or null (discarded). Default is text.'
+                        )
+    parser.add_argument("--startAt",
+                        type=float, default=None,
+                        help='Time (seconds since the epoch) at which to start executing transactions after '
+                             'connecting, so that clients started together begin at the same time.'
+                        )
+    parser.add_argument("--trace",
+                        action="store_true",
+                        help='Record per-statement latency and row counts, saved per transaction type to <file>.trace'
+                        )
     args = parser.parse_args()
-
-    host = f'xcnc{args.hostNum}.comp.nus.edu.sg'
-    port = args.port
-    user = 'root'  # use root so we don't have to grant privileges manually
-    database = args.database
-    conn = psycopg2.connect(host=host,
-                            port=port,
-                            user=user,
-                            database=database)
+    if args.sessions <= 0 and len(args.file) > 1:
+        parser.error("multiple transaction files require --sessions")
+    statements.configure(args.preparedStatements)
+    refcache.configure(args.referenceCache, args.referenceCacheSize)
+    if args.trace:
+        tracing.enable()
 
     metrics = MetricsManager()
-    transactions = setup_transactions(args.file, conn)
-    metrics_filename = os.path.splitext(os.path.basename(args.file.name))[0] + ".metrics"
-    args.file.close()
+    metrics_basename = os.path.splitext(os.path.basename(args.file[0].name))[0]
+    metrics_filename = metrics_basename + ".metrics"
+    histograms_filename = metrics_basename + ".hist"
+    trace_filename = metrics_basename + ".trace"
+    timeline_filename = metrics_basename + ".timeline"
 
-    total_execution_start = datetime.now()
-    for txn in transactions:
-        transaction_start = datetime.now()
-        retry_count = 0
-        last_error = ""
-        while True:
-            try:
-                txn.run()
-                # Flag issue if transactions had retried more than 15 times (sleep time > 5 seconds)
-                if retry_count > 10:
-                    sys.stderr.write("Transaction of type " + txn.__class__.__name__ + " retried: " + str(retry_count)
-                                     + " times before completion with error: " + last_error + " \n")
-                break
-            except SerializationFailure as e:
-                sleep_ms = (2 ** (retry_count % 16)) * 0.1 * (random.random() + 0.5)
-                time.sleep(sleep_ms / 1000)
-                last_error = str(e)
-                retry_count += 1
-                continue
-        transaction_end = datetime.now()
-        metrics.add(transaction_end - transaction_start)
+    sink = output.create_sink(args.output)
+    router = None
+    if args.routing == "leaseholder":
+        router = routing.LeaseholderRouter(args.routingTable, args.routingRefresh)
+
+    if args.sessions > 0:
+        filenames = [f.name for f in args.file]
+        for f in args.file:
+            f.close()
+
+        def pool_fn():
+            return pool.NodePool(args.hostNum, args.port, args.database, router=router)
+
+        if args.referenceCache == "preload":
+            preload_conn = pool.connect_best(args.hostNum, args.port, args.database)
+            refcache.cache.preload(preload_conn)
+            preload_conn.close()
+
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(
+                run_sessions(filenames, args.sessions, ASYNC_DRIVERS[args.driver], pool_fn,
+                             RETRY_MODES[args.retryMode], metrics, sink, args.startAt))
+        finally:
+            loop.close()
+            sink.close()
+
+        metrics.output_metrics()
+        metrics.write_metrics(metrics_filename)
+        metrics.write_histograms(histograms_filename)
+        metrics.write_timeline(timeline_filename)
+        if args.trace:
+            tracing.write_report(trace_filename)
+        return
+
+    node_pool = pool.NodePool(args.hostNum, args.port, args.database, router=router)
+    try:
+        if args.referenceCache == "preload":
+            refcache.cache.preload(node_pool.acquire()[1])
+        # Transactions are given a connection by the pool when they run
+        transactions = setup_transactions(args.file[0], None)
+        if args.startAt is not None:
+            # Connect before waiting so that connection setup is not part of the execution time
+            node_pool.acquire()
+            time.sleep(max(args.startAt - time.time(), 0))
+
+        total_execution_start = datetime.now()
+        for txn in transactions:
+            transaction_start = datetime.now()
+            retries = run_on_pool(node_pool, txn, RETRY_MODES[args.retryMode])
+            transaction_end = datetime.now()
+            metrics.add(transaction_end - transaction_start, txn.__class__.__name__, retries)
 
-        txn.print_outputs()
-    total_execution_end = datetime.now()
-    metrics.add_total_time(total_execution_end - total_execution_start)
+            sink.write(txn.__class__.__name__, txn.outputs)
+        total_execution_end = datetime.now()
+        metrics.add_total_time(total_execution_end - total_execution_start)
+        args.file[0].close()
+    finally:
+        sink.close()
 
     metrics.output_metrics()
     metrics.write_metrics(metrics_filename)
-    conn.close()
+    metrics.write_histograms(histograms_filename)
+    metrics.write_timeline(timeline_filename)
+    if args.trace:
+        tracing.write_report(trace_filename)
+    node_pool.close()
 
 
 if __name__ == '__main__':
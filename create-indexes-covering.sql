@@ -0,0 +1,5 @@
+CREATE INDEX IF NOT EXISTS "order_customer_idx" ON "order" ("o_w_id", "o_d_id", "o_c_id", "o_id" DESC) STORING ("o_entry_d", "o_carrier_id");
+
+CREATE INDEX IF NOT EXISTS "orderline_item_idx" ON "orderline" ("ol_w_id", "ol_d_id", "ol_o_id") STORING ("ol_i_id");
+
+CREATE INDEX IF NOT EXISTS "stock_quantity_idx" ON "stock" ("s_w_id", "s_i_id") STORING ("s_quantity");
\ No newline at end of file
@@ -0,0 +1 @@
+CREATE INDEX IF NOT EXISTS "customer_balance_idx" ON "customer" ("c_balance" DESC) STORING ("c_first", "c_middle", "c_last");
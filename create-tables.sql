@@ -105,6 +105,17 @@ CREATE TABLE IF NOT EXISTS "stock" (
   PRIMARY KEY ("s_w_id", "s_i_id")
 );
 
+-- Inverted index of the items ordered by each customer, led by item so that the orders containing an item
+-- are a single range read. Built by setup.py after the data is loaded and maintained by NewOrderTransaction.
+CREATE TABLE IF NOT EXISTS "item_customer" (
+  "ic_i_id" int,
+  "ic_w_id" int,
+  "ic_d_id" int,
+  "ic_c_id" int,
+  "ic_o_id" int,
+  PRIMARY KEY ("ic_i_id", "ic_w_id", "ic_d_id", "ic_o_id")
+);
+
 ALTER TABLE "district" ADD FOREIGN KEY ("d_w_id") REFERENCES "warehouse" ("w_id");
 
 ALTER TABLE "customer" ADD FOREIGN KEY ("c_w_id", "c_d_id") REFERENCES "district" ("d_w_id", "d_id");
@@ -1,3 +1,4 @@
+DROP TABLE IF EXISTS item_customer CASCADE;
 DROP TABLE IF EXISTS warehouse CASCADE;
 DROP TABLE IF EXISTS district CASCADE;
 DROP TABLE IF EXISTS customer CASCADE;
@@ -1,10 +1,13 @@
 import argparse
-import psycopg2
 from datetime import datetime
 
-def explain_related_customer(conn, file):
+import pool
+import queries
+
+
+def explain_related_customer(conn):
     with conn.cursor() as cur:
-        related_customer_query = file.read()
+        related_customer_query = queries.registry.get("related-customer")
 
         cur.execute("explain analyze " + str(related_customer_query), {
             "input_warehouse_id": 2,
@@ -15,9 +18,9 @@ def explain_related_customer(conn, file):
         print(cur.fetchone())
         
 
-def explain_top_balance(conn, file):
+def explain_top_balance(conn):
     with conn.cursor() as cur:
-        related_customer_query = file.read()
+        related_customer_query = queries.registry.get("top-balance")
 
         cur.execute(f'{related_customer_query}', {
             "current_timestamp": datetime.utcnow()
@@ -26,14 +29,15 @@ def explain_top_balance(conn, file):
         print(cur.fetchone())
         
 
-def explain_popular_item(conn, file):
+def explain_popular_item(conn):
     with conn.cursor() as cur:
-        popular_item_query = file.read()
+        popular_item_query = queries.registry.get("popular-item")
 
         cur.execute("explain analyze " + str(popular_item_query), {
             "input_warehouse_id": 1,
             "input_district_id": 7,
-            "input_num_last_orders": 47,
+            "input_first_order_id": 2954,
+            "input_next_order_id": 3001,
             "current_timestamp": datetime.utcnow()            
         })
         
@@ -45,8 +49,9 @@ def main():
     # if hostNum not specified, use default host 2 (i.e. xcnc2)
     parser = argparse.ArgumentParser()
     parser.add_argument("-hn", '--hostNum',
-                        type=int, default=2,
-                        help='Host number e.g. 2 for xcnc2. Default is xcnc2.'
+                        type=int, nargs='+', default=[2],
+                        help='Host number(s) e.g. 2 for xcnc2. Connects to the healthy host with the lowest round '
+                             'trip time. Default is xcnc2.'
                         )
     parser.add_argument("-p", '--port',
                         type=int, default=26260,
@@ -58,21 +63,11 @@ def main():
                         )
     args = parser.parse_args()
 
-    host = f'xcnc{args.hostNum}.comp.nus.edu.sg'
-    port = args.port
-    user = 'root'  # use root so we don't have to grant privileges manually
-    database = args.database
-    conn = psycopg2.connect(host=host,
-                            port=port,
-                            user=user,
-                            database=database)
+    conn = pool.connect_best(args.hostNum, args.port, args.database)
     
-    # with open('related-customer.sql', 'r') as f:
-    #     explain_related_customer(conn, f)
-    with open('top-balance.sql', 'r') as f:
-        explain_top_balance(conn, f)
-    # with open('popular-item.sql', 'r') as f:
-    #     explain_popular_item(conn, f)
+    # explain_related_customer(conn)
+    explain_top_balance(conn)
+    # explain_popular_item(conn)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,190 @@
+import argparse
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from itertools import accumulate
+
+# Transaction identifiers as parsed by client.setup_transactions
+TXN_TYPES = ["N", "P", "D", "O", "S", "I", "T", "R"]
+
+DEFAULT_MIX = "N=40,P=38,D=4,O=4,S=4,I=4,T=3,R=3"
+
+SKEWS = ["uniform", "zipf", "hotspot"]
+
+# Quantities of New-Order items, chosen uniformly
+QUANTITIES = range(1, 11)
+
+# Number of lines written at once
+WRITE_BATCH = 10000
+
+
+# Parses a mix such as N=45,P=43,D=4 into (transaction types, cumulative weights)
+def parse_mix(mix):
+    weights = {}
+    for entry in mix.split(','):
+        txn_type, weight = entry.split('=')
+        if txn_type not in TXN_TYPES:
+            raise argparse.ArgumentTypeError("unknown transaction type {}".format(txn_type))
+        weights[txn_type] = float(weight)
+    txn_types = sorted(weights, key=TXN_TYPES.index)
+    return txn_types, list(accumulate(weights[t] for t in txn_types))
+
+
+# Cumulative weights of choosing each of the num_districts (warehouse, district) pairs, the pair k being
+# district k % districts + 1 of warehouse k // districts + 1
+def district_weights(num_districts, skew, zipf_s, hotspot_fraction, hotspot_probability):
+    if skew == "zipf":
+        weights = [1 / (k + 1) ** zipf_s for k in range(num_districts)]
+    elif skew == "hotspot":
+        num_hot = max(int(num_districts * hotspot_fraction), 1)
+        hot = hotspot_probability / num_hot
+        cold = (1 - hotspot_probability) / max(num_districts - num_hot, 1)
+        weights = [hot if k < num_hot else cold for k in range(num_districts)]
+    else:
+        weights = [1] * num_districts
+    return list(accumulate(weights))
+
+
+def new_order_lines(rng, args, warehouse_id, district_id):
+    num_items = rng.randint(args.minItems, args.maxItems)
+    lines = ["N,{},{},{},{}\n".format(rng.randint(1, args.customers), warehouse_id, district_id, num_items)]
+    # Quantities drawn in a single call, as drawing random numbers one by one dominates the generation time
+    quantities = rng.choices(QUANTITIES, k=num_items)
+    for item_id, quantity in zip(rng.sample(range(1, args.items + 1), num_items), quantities):
+        supply_warehouse_id = warehouse_id
+        if args.warehouses > 1 and rng.random() < args.remoteProbability:
+            supply_warehouse_id = rng.choice([w for w in range(1, args.warehouses + 1) if w != warehouse_id])
+        lines.append("{},{},{}\n".format(item_id, supply_warehouse_id, quantity))
+    return lines
+
+
+# Returns the line(s) of a transaction of the given type on the given district
+def transaction_lines(rng, args, txn_type, warehouse_id, district_id):
+    if txn_type == "N":
+        return new_order_lines(rng, args, warehouse_id, district_id)
+    if txn_type == "P":
+        return ["P,{},{},{},{:.2f}\n".format(warehouse_id, district_id, rng.randint(1, args.customers),
+                                             rng.uniform(1, 5000))]
+    if txn_type == "D":
+        return ["D,{},{}\n".format(warehouse_id, rng.randint(1, 10))]
+    if txn_type == "O":
+        return ["O,{},{},{}\n".format(warehouse_id, district_id, rng.randint(1, args.customers))]
+    if txn_type == "S":
+        return ["S,{},{},{},{}\n".format(warehouse_id, district_id, rng.randint(10, 20), rng.randint(10, 30))]
+    if txn_type == "I":
+        return ["I,{},{},{}\n".format(warehouse_id, district_id, rng.randint(10, 30))]
+    if txn_type == "T":
+        return ["T\n"]
+    return ["R,{},{},{}\n".format(warehouse_id, district_id, rng.randint(1, args.customers))]
+
+
+# Writes the transaction file of a client, streaming the lines in batches so that memory use does not
+# depend on the number of transactions
+def generate_client(client, args):
+    rng = random.Random(args.seed * 1000003 + client)
+    txn_types, mix_weights = args.mix
+    num_districts = args.warehouses * args.districts
+    weights = district_weights(num_districts, args.skew, args.zipfS, args.hotspotFraction,
+                               args.hotspotProbability)
+    districts = range(num_districts)
+
+    filename = os.path.join(args.outDir, "{}.txt".format(client))
+    with open(filename, "w", buffering=1 << 20) as f:
+        remaining = args.transactions
+        while remaining > 0:
+            batch = min(remaining, WRITE_BATCH)
+            lines = []
+            for txn_type, k in zip(rng.choices(txn_types, cum_weights=mix_weights, k=batch),
+                                   rng.choices(districts, cum_weights=weights, k=batch)):
+                lines.extend(transaction_lines(rng, args, txn_type, k // args.districts + 1, k % args.districts + 1))
+            f.writelines(lines)
+            remaining -= batch
+    return filename
+
+
+def main():
+    # Usage: python3 generate-xacts.py <number of clients> <transactions per client> [options]
+    # Example: python3 generate-xacts.py 20 100000 --skew zipf --seed 1
+    parser = argparse.ArgumentParser()
+    parser.add_argument("clients",
+                        type=int,
+                        help='Number of transaction files to write, {i}.txt for i from 1')
+    parser.add_argument("transactions",
+                        type=int,
+                        help='Number of transactions per file')
+    parser.add_argument("-o", '--outDir',
+                        type=str, default="xact-files",
+                        help='Directory the files are written to. Default is xact-files.'
+                        )
+    parser.add_argument("-m", '--mix',
+                        type=parse_mix, default=DEFAULT_MIX,
+                        help='Relative weights of the transaction types, by identifier as in the transaction files. '
+                             'Default is {}.'.format(DEFAULT_MIX)
+                        )
+    parser.add_argument("-wh", '--warehouses',
+                        type=int, default=10,
+                        help='Number of warehouses in the data. Default is 10.'
+                        )
+    parser.add_argument("--districts",
+                        type=int, default=10,
+                        help='Number of districts per warehouse. Default is 10.'
+                        )
+    parser.add_argument("--customers",
+                        type=int, default=3000,
+                        help='Number of customers per district. Default is 3000.'
+                        )
+    parser.add_argument("--items",
+                        type=int, default=100000,
+                        help='Number of items. Default is 100000.'
+                        )
+    parser.add_argument("--minItems",
+                        type=int, default=5,
+                        help='Minimum number of items in a New-Order. Default is 5.'
+                        )
+    parser.add_argument("--maxItems",
+                        type=int, default=15,
+                        help='Maximum number of items in a New-Order. Default is 15.'
+                        )
+    parser.add_argument("--remoteProbability",
+                        type=float, default=0.01,
+                        help='Probability of a New-Order item being supplied by another warehouse. Default is 0.01.'
+                        )
+    parser.add_argument("--skew",
+                        choices=SKEWS, default="uniform",
+                        help='Distribution of the transactions over the districts of all warehouses: uniform, zipf '
+                             '(the k-th district is chosen with weight 1 / k^s) or hotspot (a fraction of the '
+                             'districts gets most transactions). Default is uniform.'
+                        )
+    parser.add_argument("--zipfS",
+                        type=float, default=1.0,
+                        help='Exponent s of the zipf skew. Default is 1.'
+                        )
+    parser.add_argument("--hotspotFraction",
+                        type=float, default=0.1,
+                        help='Fraction of the districts that are hot with the hotspot skew. Default is 0.1.'
+                        )
+    parser.add_argument("--hotspotProbability",
+                        type=float, default=0.9,
+                        help='Probability of a transaction being on a hot district with the hotspot skew. '
+                             'Default is 0.9.'
+                        )
+    parser.add_argument("--seed",
+                        type=int, default=0,
+                        help='Seed of the generator, the same seed and options give the same files. Default is 0.'
+                        )
+    parser.add_argument("-w", '--workers',
+                        type=int, default=os.cpu_count(),
+                        help='Number of files generated concurrently. Default is the number of CPUs.'
+                        )
+    args = parser.parse_args()
+    if not 1 <= args.minItems <= args.maxItems <= args.items:
+        parser.error("item counts must satisfy 1 <= minItems <= maxItems <= items")
+
+    os.makedirs(args.outDir, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        for filename in executor.map(generate_client, range(1, args.clients + 1), [args] * args.clients):
+            print("Wrote {}".format(filename))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+import json
+import math
+
+# Latencies (in milliseconds) are counted in logarithmically sized buckets, each spanning PRECISION of its
+# lower bound, so percentiles are accurate to within 1% and memory does not grow with the number of values.
+# Values below MIN_LATENCY_MS fall in the first bucket and values above MAX_LATENCY_MS in the last one.
+MIN_LATENCY_MS = 0.01
+MAX_LATENCY_MS = 3600 * 1000
+PRECISION = 0.01
+LOG_BASE = math.log(1 + PRECISION)
+NUM_BUCKETS = int(math.ceil(math.log(MAX_LATENCY_MS / MIN_LATENCY_MS) / LOG_BASE)) + 1
+
+HISTOGRAM_FORMAT_VERSION = 1
+
+
+def bucket_index(value):
+    if value <= MIN_LATENCY_MS:
+        return 0
+    return min(int(math.log(value / MIN_LATENCY_MS) / LOG_BASE) + 1, NUM_BUCKETS - 1)
+
+
+# Upper bound of the values counted in a bucket
+def bucket_value(index):
+    return MIN_LATENCY_MS * (1 + PRECISION) ** index
+
+
+class LatencyHistogram:
+    def __init__(self):
+        self.counts = [0] * NUM_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def record(self, value):
+        self.counts[bucket_index(value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other):
+        for i, count in enumerate(other.counts):
+            if count:
+                self.counts[i] += count
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    # Empty histograms have a mean and percentiles of 0
+    def mean(self):
+        if self.count == 0:
+            return 0.0
+        return self.total / self.count
+
+    # Same rank definition as taking the ceil(count * percentile / 100)th smallest value
+    def percentile(self, percentile):
+        if self.count == 0:
+            return 0.0
+        rank = max(int(math.ceil((self.count * percentile) / 100)), 1)
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return min(max(bucket_value(i), self.min), self.max)
+        return self.max
+
+    # Only non-empty buckets are stored
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "total": self.total,
+            "min": self.min,
+            "max": self.max,
+            "buckets": {str(i): count for i, count in enumerate(self.counts) if count},
+        }
+
+    @staticmethod
+    def from_dict(data):
+        histogram = LatencyHistogram()
+        histogram.count = data["count"]
+        histogram.total = data["total"]
+        histogram.min = data["min"]
+        histogram.max = data["max"]
+        for i, count in data["buckets"].items():
+            histogram.counts[int(i)] = count
+        return histogram
+
+
+def merge_histograms(histograms):
+    merged = LatencyHistogram()
+    for histogram in histograms:
+        merged.merge(histogram)
+    return merged
+
+
+# Writes histograms keyed by transaction type as JSON. Files written with the same bucket layout
+# can be merged by reading them back and summing their histograms.
+def write_histograms(histograms, filename):
+    with open(filename, "w") as f:
+        json.dump({
+            "version": HISTOGRAM_FORMAT_VERSION,
+            "min_latency_ms": MIN_LATENCY_MS,
+            "precision": PRECISION,
+            "histograms": {name: histogram.to_dict() for name, histogram in histograms.items()},
+        }, f)
+
+
+def read_histograms(filename):
+    with open(filename, "r") as f:
+        data = json.load(f)
+    if (data["version"] != HISTOGRAM_FORMAT_VERSION or data["min_latency_ms"] != MIN_LATENCY_MS
+            or data["precision"] != PRECISION):
+        raise ValueError("{} was written with an incompatible histogram layout".format(filename))
+    return {name: LatencyHistogram.from_dict(histogram) for name, histogram in data["histograms"].items()}
@@ -0,0 +1,95 @@
+import io
+import json
+import queue
+import sys
+import threading
+
+# Output sinks, selected with client.py -o
+SINK_TYPES = ["text", "buffered", "jsonl", "null"]
+
+# Size of the buffer of the background writer's stream
+BUFFER_SIZE = 1 << 20
+
+# Maximum number of outputs waiting to be written before transactions block on the writer
+MAX_QUEUED_OUTPUTS = 10000
+
+
+# Output of a transaction as text, one output per line
+def format_text(transaction_type, outputs):
+    return "".join("{}: {}\n".format(k, v) for k, v in outputs.items())
+
+
+# Output of a transaction as a single JSON object per line. Values that are not JSON types
+# (Decimal, datetime) are written as their string form.
+def format_jsonl(transaction_type, outputs):
+    return json.dumps({"transaction": transaction_type, "outputs": outputs}, default=str) + "\n"
+
+
+# Writes outputs to stdout as soon as each transaction completes
+class TextSink:
+    def write(self, transaction_type, outputs):
+        sys.stdout.write(format_text(transaction_type, outputs))
+
+    def close(self):
+        sys.stdout.flush()
+
+
+# Discards outputs, for pure load tests
+class NullSink:
+    def write(self, transaction_type, outputs):
+        pass
+
+    def close(self):
+        pass
+
+
+# Queues raw outputs to a writer thread, which formats them and writes them to stdout in large buffered writes
+# so that transactions do not wait on formatting or on stdout. If the writer fails, its error is raised by the
+# next write or close and no more outputs are accepted.
+class BackgroundSink:
+    def __init__(self, formatter):
+        self.formatter = formatter
+        self.queue = queue.Queue(MAX_QUEUED_OUTPUTS)
+        self.error = None
+        self.closed = False
+        sys.stdout.flush()
+        self.stream = io.open(sys.stdout.fileno(), "w", buffering=BUFFER_SIZE, closefd=False)
+        self.thread = threading.Thread(target=self._write_outputs)
+        self.thread.start()
+
+    def write(self, transaction_type, outputs):
+        if self.error is not None:
+            raise self.error
+        self.queue.put((transaction_type, outputs))
+
+    def _write_outputs(self):
+        try:
+            while True:
+                record = self.queue.get()
+                if record is None:
+                    break
+                self.stream.write(self.formatter(*record))
+            self.stream.flush()
+        except Exception as e:
+            self.error = e
+            # Keep taking outputs so that writers blocked on a full queue can see the error
+            while self.queue.get() is not None:
+                pass
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.queue.put(None)
+            self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+
+def create_sink(sink_type):
+    if sink_type == "buffered":
+        return BackgroundSink(format_text)
+    if sink_type == "jsonl":
+        return BackgroundSink(format_jsonl)
+    if sink_type == "null":
+        return NullSink()
+    return TextSink()
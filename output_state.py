@@ -1,6 +1,42 @@
 import argparse
+import queue
+from concurrent.futures import ThreadPoolExecutor
+
 import psycopg2
 
+import pool
+
+# Aggregate queries giving the 15 statistics in order, with the warehouse id column of the tables that can be
+# summed per warehouse in partitioned mode
+STATE_QUERIES = [
+    ("SELECT SUM(w_ytd) FROM warehouse", None),
+    ("SELECT SUM(d_ytd), SUM(d_next_o_id) FROM district", None),
+    ("SELECT SUM(c_balance), SUM(c_ytd_payment), SUM(c_payment_cnt), SUM(c_delivery_cnt) FROM customer", None),
+    ("SELECT MAX(o_id), SUM(o_ol_cnt) FROM \"order\"", None),
+    ("SELECT SUM(ol_amount), SUM(ol_quantity) FROM orderline", "ol_w_id"),
+    ("SELECT SUM(s_quantity), SUM(s_ytd), SUM(s_order_cnt), SUM(s_remote_cnt) FROM stock", "s_w_id"),
+]
+
+
+# Runs a query on one of the idle connections of conns, returning its single row
+def run_query(conns, sql, params):
+    conn = conns.get()
+    try:
+        with conn.cursor() as curs:
+            curs.execute(sql, params)
+            return curs.fetchone()
+    finally:
+        conns.put(conn)
+
+
+# Adds up the partial sums of each column, ignoring the partitions without rows
+def merge_sums(rows):
+    state = []
+    for values in zip(*rows):
+        values = [x for x in values if x is not None]
+        state.append(sum(values) if values else None)
+    return state
+
 
 def main():
     # Usage: python3 output_state.py <output file name> <hostNum> <port> <db>
@@ -11,8 +47,9 @@ def main():
                         type=argparse.FileType('w'),
                         help='Transaction file for client')
     parser.add_argument("-hn", '--hostNum',
-                        type=int, default=2,
-                        help='Host number e.g. 2 for xcnc2. Default is xcnc2.'
+                        type=int, nargs='+', default=[2],
+                        help='Host number(s) e.g. 2 for xcnc2. Connects to the healthy host with the lowest round '
+                             'trip time. Default is xcnc2.'
                         )
     parser.add_argument("-p", '--port',
                         type=int, default=26260,
@@ -22,39 +59,62 @@ def main():
                         type=str, default="project",
                         help='Database name'
                         )
+    parser.add_argument("-j", '--jobs',
+                        type=int, default=6,
+                        help='Number of queries run concurrently, each over a connection of its own. Default is 6.'
+                        )
+    parser.add_argument("-pt", '--partitioned',
+                        action="store_true",
+                        help='Sum orderline and stock per warehouse in separate queries and add up the results.'
+                        )
     args = parser.parse_args()
 
-    host = f'xcnc{args.hostNum}.comp.nus.edu.sg'
-    port = args.port
-    user = 'root'  # use root so we don't have to grant privileges manually
-    database = args.database
-    conn = psycopg2.connect(host=host,
-                            port=port,
-                            user=user,
-                            database=database)
+    # All connections are opened to the node that gives the timestamp, as the clock of another node may be behind
+    # it and reject reads at a timestamp in its future
+    first_conn = pool.connect_best(args.hostNum, args.port, args.database)
+    conns = queue.Queue()
+    for i in range(args.jobs):
+        conn = first_conn if i == 0 else psycopg2.connect(first_conn.dsn)
+        # AS OF SYSTEM TIME is only allowed outside of explicit transactions
+        conn.set_session(autocommit=True)
+        conns.put(conn)
 
-    state = []
+    # All queries read at the same timestamp so that the statistics are consistent with each other
+    with first_conn.cursor() as curs:
+        curs.execute("SELECT cluster_logical_timestamp();")
+        timestamp = curs.fetchone()[0]
+    warehouse_ids = []
+    if args.partitioned:
+        conn = conns.get()
+        with conn.cursor() as curs:
+            curs.execute("SELECT w_id FROM warehouse AS OF SYSTEM TIME %s;", (timestamp,))
+            warehouse_ids = [row[0] for row in curs.fetchall()]
+        conns.put(conn)
+
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        futures = []
+        for sql, warehouse_column in STATE_QUERIES:
+            if warehouse_ids and warehouse_column is not None:
+                futures.append([executor.submit(run_query, conns,
+                                                sql + " AS OF SYSTEM TIME %s WHERE {} = %s;".format(warehouse_column),
+                                                (timestamp, warehouse_id))
+                                for warehouse_id in warehouse_ids])
+            else:
+                futures.append([executor.submit(run_query, conns, sql + " AS OF SYSTEM TIME %s;", (timestamp,))])
+
+        state = []
+        for query_futures in futures:
+            rows = [future.result() for future in query_futures]
+            state.extend(rows[0] if len(rows) == 1 else merge_sums(rows))
+
+    while not conns.empty():
+        conns.get().close()
 
-    with conn.cursor() as curs:
-        curs.execute("SELECT SUM(w_ytd) FROM warehouse;")
-        state.extend(curs.fetchone())
-        curs.execute("SELECT SUM(d_ytd), SUM(d_next_o_id) FROM district;")
-        state.extend(curs.fetchone())
-        curs.execute(
-            "SELECT SUM(c_balance), SUM(c_ytd_payment), SUM(c_payment_cnt), SUM(c_delivery_cnt) FROM customer;")
-        state.extend(curs.fetchone())
-        curs.execute("SELECT MAX(o_id), SUM(o_ol_cnt) FROM \"order\";")
-        state.extend(curs.fetchone())
-        curs.execute("SELECT SUM(ol_amount), SUM(ol_quantity) FROM orderline;")
-        state.extend(curs.fetchone())
-        curs.execute("SELECT SUM(s_quantity), SUM(s_ytd), SUM(s_order_cnt), SUM(s_remote_cnt) FROM stock;")
-        state.extend(curs.fetchone())
-
-        assert len(state) == 15
-        print(state)
-        state_string = [str(x) for x in state]
-        args.file.write(",".join(state_string))
-        args.file.close()
+    assert len(state) == 15
+    print(state)
+    state_string = [str(x) for x in state]
+    args.file.write(",".join(state_string))
+    args.file.close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,144 @@
+import logging
+import time
+
+import psycopg2
+
+# Weight of the latest sample in the moving averages of round trip time and error rate
+EWMA_WEIGHT = 0.3
+
+# Rounds of connection attempts to every node made by connect_best before giving up, and seconds between them
+CONNECT_ATTEMPTS = 3
+CONNECT_RETRY_INTERVAL = 1.0
+
+
+def connect(host_num, port, database):
+    host = f'xcnc{host_num}.comp.nus.edu.sg'
+    user = 'root'  # use root so we don't have to grant privileges manually
+    return psycopg2.connect(host=host,
+                            port=port,
+                            user=user,
+                            database=database)
+
+
+# Errors raised by psycopg2 when the connection itself failed carry no SQLSTATE,
+# unlike errors returned by the cluster for a statement
+def is_connection_error(e):
+    return isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError)) and e.pgcode is None
+
+
+class Node:
+    def __init__(self, host_num, port):
+        self.host_num = host_num
+        self.port = port
+        self.conn = None
+        self.rtt_ms = None
+        self.error_rate = 0.0
+        self.unhealthy_until = 0.0
+        self.last_probe = 0.0
+
+    def is_healthy(self, now):
+        return now >= self.unhealthy_until
+
+    # Lower is better, errors make a node look proportionally slower
+    def score(self):
+        return (self.rtt_ms if self.rtt_ms is not None else float("inf")) * (1 + 10 * self.error_rate)
+
+    # Address as advertised by the cluster's nodes
+    @property
+    def address(self):
+        return f'xcnc{self.host_num}.comp.nus.edu.sg:{self.port}'
+
+    def __str__(self):
+        return f'xcnc{self.host_num}:{self.port}'
+
+
+# Connections to every node of the cluster, handing out the connection to the healthy node with the lowest
+# round trip time and error rate. Round trip times are measured with SELECT 1 at most every probe_interval
+# seconds per node. A node whose connection fails is reconnected to after cooldown seconds.
+# With a router (see routing.py), transactions on a warehouse go to its leaseholder whenever it is healthy.
+# Not thread safe: each session should use its own pool.
+class NodePool:
+    def __init__(self, host_nums, port, database, probe_interval=5.0, cooldown=10.0, router=None):
+        self.nodes = [Node(host_num, port) for host_num in host_nums]
+        self.database = database
+        self.probe_interval = probe_interval
+        self.cooldown = cooldown
+        self.router = router
+        # Error of the last failed probe
+        self.last_error = None
+
+    def _probe(self, node, now):
+        node.last_probe = now
+        try:
+            if node.conn is None or node.conn.closed:
+                node.conn = connect(node.host_num, node.port, self.database)
+            start = time.perf_counter()
+            with node.conn:
+                with node.conn.cursor() as curs:
+                    curs.execute("SELECT 1;")
+                    curs.fetchone()
+            rtt_ms = (time.perf_counter() - start) * 1000
+            node.rtt_ms = rtt_ms if node.rtt_ms is None else (1 - EWMA_WEIGHT) * node.rtt_ms + EWMA_WEIGHT * rtt_ms
+        except psycopg2.Error as e:
+            logging.warning("Probe of %s failed: %s", node, e)
+            self.last_error = e
+            self.report_failure(node)
+
+    # Returns (node, connection) of the leaseholder for warehouse_id if known and healthy, otherwise of the best
+    # healthy node, waiting for a node to come back if none is healthy. With attempts, the error of the last failed
+    # probe is raised once no node could be connected to in that many rounds.
+    def acquire(self, warehouse_id=None, attempts=None):
+        while True:
+            now = time.monotonic()
+            for node in self.nodes:
+                if node.is_healthy(now) and (node.conn is None or now - node.last_probe >= self.probe_interval):
+                    self._probe(node, now)
+
+            healthy = [node for node in self.nodes if node.is_healthy(now) and node.conn is not None]
+            if healthy:
+                node = min(healthy, key=Node.score)
+                if self.router is not None and warehouse_id is not None:
+                    self.router.maybe_refresh(node.conn)
+                    address = self.router.address_for(warehouse_id)
+                    for leaseholder in healthy:
+                        if leaseholder.address == address:
+                            return leaseholder, leaseholder.conn
+                return node, node.conn
+
+            if attempts is not None:
+                attempts -= 1
+                if attempts <= 0:
+                    raise self.last_error
+
+            # Wait until the first node leaves its cooldown
+            time.sleep(max(min(node.unhealthy_until for node in self.nodes) - now, 0.1))
+
+    def report_success(self, node):
+        node.error_rate = (1 - EWMA_WEIGHT) * node.error_rate
+
+    def report_failure(self, node):
+        node.error_rate = (1 - EWMA_WEIGHT) * node.error_rate + EWMA_WEIGHT
+        node.unhealthy_until = time.monotonic() + self.cooldown
+        if node.conn is not None:
+            try:
+                node.conn.close()
+            except psycopg2.Error:
+                pass
+            node.conn = None
+
+    def close(self):
+        for node in self.nodes:
+            if node.conn is not None:
+                node.conn.close()
+                node.conn = None
+
+
+# Connects to the best node among host_nums, for scripts that only need a single connection.
+# Raises the last connection error if no node is reachable.
+def connect_best(host_nums, port, database):
+    pool = NodePool(host_nums, port, database, cooldown=CONNECT_RETRY_INTERVAL)
+    best, conn = pool.acquire(attempts=CONNECT_ATTEMPTS)
+    for node in pool.nodes:
+        if node is not best and node.conn is not None:
+            node.conn.close()
+    return conn
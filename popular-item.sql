@@ -2,14 +2,13 @@ WITH lastLOrderLines AS (
     SELECT
         *
     FROM
-        district
-        JOIN "order" ON d_w_id = o_w_id AND d_id = o_d_id
+        "order"
         JOIN orderLine ON o_w_id = ol_w_id AND o_d_id = ol_d_id AND o_id = ol_o_id
     WHERE
-        o_id < d_next_o_id
-        AND ol_d_id = %(input_district_id)s
+        ol_d_id = %(input_district_id)s
         AND ol_w_id = %(input_warehouse_id)s
-        AND o_id >= d_next_o_id - %(input_num_last_orders)s
+        AND ol_o_id >= %(input_first_order_id)s
+        AND ol_o_id < %(input_next_order_id)s
 )
 SELECT
     ol_o_id,
@@ -0,0 +1,35 @@
+import os
+import re
+
+# Transaction queries are resolved relative to this file so that the client can be run from any directory
+QUERY_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Named placeholders that each query file must use
+QUERY_PLACEHOLDERS = {
+    "popular-item": {"input_warehouse_id", "input_district_id", "input_first_order_id", "input_next_order_id"},
+    "top-balance": {"current_timestamp"},
+    "related-customer": {"input_warehouse_id", "input_district_id", "input_customer_id", "current_timestamp"},
+}
+
+PLACEHOLDER_PATTERN = re.compile(r"%\((\w+)\)s")
+
+
+# Loads every transaction query once and checks that its placeholders match the parameters passed by
+# the transaction classes, so that a broken .sql file fails at startup rather than mid experiment
+class QueryRegistry:
+    def __init__(self, query_dir=QUERY_DIR):
+        self.queries = {}
+        for name, placeholders in QUERY_PLACEHOLDERS.items():
+            with open(os.path.join(query_dir, name + ".sql"), 'r') as f:
+                query = f.read()
+            found = set(PLACEHOLDER_PATTERN.findall(query))
+            if found != placeholders:
+                raise ValueError("{}.sql uses placeholders {}, expected {}".format(
+                    name, sorted(found), sorted(placeholders)))
+            self.queries[name] = query
+
+    def get(self, name):
+        return self.queries[name]
+
+
+registry = QueryRegistry()
@@ -0,0 +1,74 @@
+from collections import OrderedDict
+import threading
+
+# Reference cache modes, selected with client.py -rc
+CACHE_MODES = ["off", "lazy", "preload"]
+
+
+# Client-side cache of reference data that never changes during an experiment (item name and price,
+# warehouse tax), shared by all sessions of a client. Holds at most max_entries rows, evicting the least
+# recently used. A cache with max_entries 0 is disabled: lookups always miss and rows are never stored.
+class ReferenceCache:
+    def __init__(self, max_entries=0):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _get(self, key):
+        value = self.entries.get(key)
+        if value is not None:
+            self.entries.move_to_end(key)
+        return value
+
+    def _put(self, key, value):
+        if self.max_entries <= 0:
+            return
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    # Returns {i_id: (i_name, i_price)} for the cached items among item_ids
+    def get_items(self, item_ids):
+        items = {}
+        with self.lock:
+            for i_id in item_ids:
+                item = self._get(("item", i_id))
+                if item is not None:
+                    items[i_id] = item
+        return items
+
+    def put_item(self, i_id, name, price):
+        with self.lock:
+            self._put(("item", i_id), (name, price))
+
+    def get_warehouse_tax(self, w_id):
+        with self.lock:
+            return self._get(("warehouse", w_id))
+
+    def put_warehouse_tax(self, w_id, tax):
+        with self.lock:
+            self._put(("warehouse", w_id), tax)
+
+    # Fills the cache in bulk, warehouses first as they are the most frequently read
+    def preload(self, conn):
+        if self.max_entries <= 0:
+            return
+        with conn:
+            with conn.cursor() as curs:
+                curs.execute("SELECT w_id, w_tax FROM warehouse;")
+                for w_id, tax in curs.fetchall():
+                    self.put_warehouse_tax(w_id, tax)
+
+                curs.execute("SELECT i_id, i_name, i_price FROM item ORDER BY i_id LIMIT %s;",
+                             (max(self.max_entries - len(self.entries), 0),))
+                for i_id, name, price in curs:
+                    self.put_item(i_id, name, price)
+
+
+cache = ReferenceCache()
+
+
+def configure(mode, max_entries):
+    global cache
+    cache = ReferenceCache(max_entries if mode != "off" else 0)
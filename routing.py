@@ -0,0 +1,72 @@
+import bisect
+import logging
+import threading
+import time
+
+import psycopg2
+
+
+# Parses the leading integer columns of a range start key, e.g. (3, 5) for /3/5 and () for NULL or /Min.
+# Keys compare as these tuples, so that (3,) sorts before every other key of warehouse 3.
+def parse_start_key(start_key):
+    columns = []
+    for column in (start_key or '').split('/')[1:]:
+        if not column.isdigit():
+            break
+        columns.append(int(column))
+    return tuple(columns)
+
+
+# Map of warehouse id to the address of the node holding the lease on the range containing the warehouse's
+# first rows of table, discovered from the cluster's range metadata and refreshed every refresh_interval seconds.
+# All tables in create-tables.sql are keyed by warehouse id first, so their leases follow the same split points.
+# If table is not split by warehouse, no address is known and transactions are routed by latency.
+# Shared by all sessions of a client.
+class LeaseholderRouter:
+    def __init__(self, table="district", refresh_interval=60.0):
+        self.table = table
+        self.refresh_interval = refresh_interval
+        # (parsed start keys of the ranges in order, leaseholder address of each range), replaced as a whole so
+        # that concurrent lookups see a consistent map
+        self.ranges = ([], [])
+        self.last_refresh = None
+        self.lock = threading.Lock()
+
+    def refresh(self, conn):
+        with conn:
+            with conn.cursor() as curs:
+                curs.execute("SELECT node_id, address FROM crdb_internal.gossip_nodes;")
+                addresses = dict(curs.fetchall())
+                curs.execute("SELECT start_key, lease_holder FROM [SHOW RANGES FROM TABLE {}];".format(self.table))
+                ranges = curs.fetchall()
+
+        ranges = sorted((parse_start_key(start_key), addresses.get(lease_holder)) for start_key, lease_holder in ranges)
+        if not any(start for start, _ in ranges):
+            logging.warning("%s is not split by warehouse, routing transactions by latency instead of leaseholder",
+                            self.table)
+            ranges = []
+        self.ranges = ([start for start, _ in ranges], [address for _, address in ranges])
+
+    # Refreshes the map if it is stale, unless another session is already refreshing it
+    def maybe_refresh(self, conn):
+        now = time.monotonic()
+        if self.last_refresh is not None and now - self.last_refresh < self.refresh_interval:
+            return
+        if not self.lock.acquire(blocking=False):
+            return
+        try:
+            self.refresh(conn)
+        except psycopg2.Error as e:
+            logging.warning("Could not refresh leaseholders of %s: %s", self.table, e)
+        finally:
+            self.last_refresh = now
+            self.lock.release()
+
+    # Returns the address (host:port) of the leaseholder for the warehouse, None if unknown. The range holding
+    # the warehouse's first rows is the last one starting at or before the warehouse's first key.
+    def address_for(self, warehouse_id):
+        range_starts, range_addresses = self.ranges
+        i = bisect.bisect_right(range_starts, (warehouse_id,)) - 1
+        if i < 0:
+            return None
+        return range_addresses[i]
@@ -0,0 +1,155 @@
+import argparse
+import importlib.util
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+# Files written by each client {i} in the working directory, moved to the experiment folder once it finishes
+CLIENT_OUTPUTS = ["{}_output.out", "{}_stats.out", "{}.metrics", "{}.hist", "{}.timeline", "{}.trace"]
+
+# Seconds between checks of the clients' status
+POLL_INTERVAL = 0.5
+
+# Directory of this script, client.py and aggregate-metrics.py, so that experiments can be run from any directory
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_aggregate_metrics():
+    spec = importlib.util.spec_from_file_location(
+        "aggregate_metrics", os.path.join(SCRIPT_DIR, "aggregate-metrics.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# Returns a function pinning the process it runs in to a single CPU, None if pinning is not supported
+def pin_to_cpu(cpu):
+    if not hasattr(os, "sched_setaffinity"):
+        return None
+    return lambda: os.sched_setaffinity(0, {cpu})
+
+
+# Starts client i (from 1) on transaction file {xact_dir}/{i}.txt, assigning hosts round robin
+def start_client(i, args, client_args, start_at):
+    host_num = args.hostNum[(i - 1) % len(args.hostNum)]
+    command = [sys.executable, os.path.join(SCRIPT_DIR, "client.py"), os.path.join(args.xactDir, "{}.txt".format(i)),
+               "-hn", str(host_num), "-p", str(args.port), "--startAt", str(start_at)] + client_args
+    preexec_fn = pin_to_cpu((i - 1) % os.cpu_count()) if args.pin else None
+    sys.stderr.write("Running client {} on {}.txt, host num {}, port {}\n".format(i, i, host_num, args.port))
+    with open("{}_output.out".format(i), "w") as stdout, open("{}_stats.out".format(i), "w") as stderr:
+        return subprocess.Popen(command, stdout=stdout, stderr=stderr, preexec_fn=preexec_fn)
+
+
+# Waits for all clients to exit, killing those still running after the deadline (in seconds since the epoch),
+# and returns {client: (exit code, seconds since start_at)}
+def wait_for_clients(processes, start_at, deadline):
+    results = {}
+    while len(results) < len(processes):
+        now = time.time()
+        for i, process in processes.items():
+            if i in results:
+                continue
+            if process.poll() is None and deadline is not None and now >= deadline:
+                sys.stderr.write("Client {} still running at the deadline, killing it\n".format(i))
+                process.kill()
+                process.wait()
+            if process.returncode is not None:
+                results[i] = (process.returncode, now - start_at)
+                summary = ""
+                if os.path.exists("{}.metrics".format(i)):
+                    with open("{}.metrics".format(i), "r") as f:
+                        metrics = f.read().split(",")
+                    summary = ", {} transactions at {:.2f} transactions / s".format(metrics[0], float(metrics[2]))
+                sys.stderr.write("Client {} exited with code {} after {:.1f}s{} ({}/{} done)\n".format(
+                    i, process.returncode, now - start_at, summary, len(results), len(processes)))
+        if len(results) < len(processes):
+            time.sleep(POLL_INTERVAL)
+    return results
+
+
+def main():
+    # Usage: python3 run-experiment.py <number of clients> [-hn <hostNum> ...] [-p <port>] [client.py options]
+    # Example: python3 run-experiment.py 20 -hn 0 1 2 3 -p 26260 --pin --deadline 3600
+    # Options not listed below are passed on to every client.py
+    # Abbreviations are disabled so that client.py options are never taken for options of this script
+    parser = argparse.ArgumentParser(allow_abbrev=False)
+    parser.add_argument("clients",
+                        type=int,
+                        help='Number of clients to run. Client {i} reads <xactDir>/{i}.txt.')
+    parser.add_argument("-hn", '--hostNum',
+                        type=int, nargs='+', default=[0, 1, 2, 3, 4],
+                        help='Host numbers e.g. 2 for xcnc2, assigned to clients round robin. Default is 0 1 2 3 4.'
+                        )
+    parser.add_argument("-p", '--port',
+                        type=int, default=26260,
+                        help='Port e.g. 26260. Default is 26260.'
+                        )
+    parser.add_argument("-n", '--nodes',
+                        type=int, default=None,
+                        help='Number of nodes in the cluster, used to name the experiment folder. '
+                             'Default is the number of hosts.'
+                        )
+    parser.add_argument("-x", '--xactDir',
+                        type=str, default="xact-files",
+                        help='Directory of the transaction files. Default is xact-files.'
+                        )
+    parser.add_argument("-f", '--folder',
+                        type=str, default=None,
+                        help='Folder the outputs of the clients are moved to. '
+                             'Default is run-<clients>-node-<nodes>.'
+                        )
+    parser.add_argument("--pin",
+                        action="store_true",
+                        help='Pin each client to a CPU of this machine, round robin.'
+                        )
+    parser.add_argument("--startDelay",
+                        type=float, default=5.0,
+                        help='Seconds given to the clients to start and connect before they all begin executing '
+                             'transactions at the same time. Default is 5.'
+                        )
+    parser.add_argument("--deadline",
+                        type=float, default=None,
+                        help='Seconds after the start at which clients still running are killed. Default is none.'
+                        )
+    args, client_args = parser.parse_known_args()
+    nodes = args.nodes if args.nodes is not None else len(args.hostNum)
+    folder = args.folder if args.folder is not None else "run-{}-node-{}".format(args.clients, nodes)
+
+    start_at = time.time() + args.startDelay
+    deadline = start_at + args.deadline if args.deadline is not None else None
+    processes = {i: start_client(i, args, client_args, start_at) for i in range(1, args.clients + 1)}
+    results = wait_for_clients(processes, start_at, deadline)
+
+    os.makedirs(folder, exist_ok=True)
+    for i in processes:
+        for name in CLIENT_OUTPUTS:
+            if os.path.exists(name.format(i)):
+                shutil.move(name.format(i), os.path.join(folder, name.format(i)))
+    with open(os.path.join(folder, "exit-codes.csv"), "w") as f:
+        f.write("client,exit_code,seconds\n")
+        for i, (exit_code, seconds) in sorted(results.items()):
+            f.write("{},{},{:.1f}\n".format(i, exit_code, seconds))
+
+    failed = [i for i, (exit_code, _) in results.items() if exit_code != 0]
+    if failed:
+        sys.stderr.write("Clients {} did not complete, skipping aggregation\n".format(sorted(failed)))
+        sys.exit(1)
+
+    # Aggregates are written inside the experiment folder
+    aggregate_metrics = load_aggregate_metrics()
+    cwd = os.getcwd()
+    os.chdir(folder)
+    try:
+        aggregate_metrics.write_clients_csv(["."], [args.clients])
+        aggregate_metrics.write_aggregate_metrics(["."])
+        aggregate_metrics.write_global_percentiles(["."])
+        aggregate_metrics.write_throughput_timeline(["."])
+    finally:
+        os.chdir(cwd)
+    sys.stderr.write("Outputs and aggregates saved to {}\n".format(folder))
+
+
+if __name__ == '__main__':
+    main()
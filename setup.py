@@ -1,14 +1,47 @@
 import csv
+import io
+import os
+import queue
 import psycopg2
 import psycopg2.errorcodes
 import time
 import logging
 import random
+import re
 import sys
 import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pool
 
 logging.basicConfig(level=logging.DEBUG)
 
+# import runs load-data.sql as is, parallel pre-splits the tables and runs its IMPORT statements concurrently,
+# copy streams the local csv files named in load-data.sql with COPY FROM STDIN
+LOADERS = ['import', 'parallel', 'copy']
+
+# Order in which the copy loader loads the tables, referenced tables first so that foreign keys can be checked
+COPY_ORDER = ['warehouse', 'item', 'district', 'customer', 'order', 'orderline', 'stock']
+
+# Tables whose primary key starts with the warehouse id, pre-split at every warehouse by the parallel loader
+WAREHOUSE_TABLES = ['warehouse', 'district', 'customer', 'order', 'orderline', 'stock']
+
+# Number of orders whose items are added to item_customer per transaction
+ORDERS_PER_INDEX_BATCH = 1000
+
+# Table definitions of each schema layout. IMPORT INTO does not support interleaved tables, so the interleaved
+# schema can only be loaded with the copy loader.
+SCHEMAS = {
+    'default': 'create-tables.sql',
+    'interleaved': 'create-tables-interleaved.sql',
+}
+
+# Files of the secondary indexes created by each index profile, in order
+INDEX_PROFILES = {
+    'default': ['create-indexes.sql'],
+    'covering': ['create-indexes.sql', 'create-indexes-covering.sql'],
+}
+
 
 def execSqlFromFile(conn, file):
     execSqlTransaction(conn, file.read())
@@ -24,8 +57,8 @@ def execSqlTransaction(conn, query: str):
         conn.rollback()
 
 
-def createTables(conn):
-    with open('create-tables.sql', 'r') as f:
+def createTables(conn, schema='default'):
+    with open(SCHEMAS[schema], 'r') as f:
         execSqlFromFile(conn, f)
 
 
@@ -36,20 +69,192 @@ def loadData(conn):
     conn.set_session(autocommit=False)
 
 
+# Returns (table, statement) for every IMPORT INTO statement of load-data.sql
+def readImportStatements():
+    with open('load-data.sql', 'r') as f:
+        statements = [statement.strip() for statement in f.read().split(';') if statement.strip()]
+    return [(re.match(r'IMPORT INTO "?(\w+)"?', statement).group(1), statement) for statement in statements]
+
+
+# Returns {table: (columns, csv file name)} from the IMPORT INTO statements of load-data.sql
+def readImportSources():
+    sources = {}
+    for table, statement in readImportStatements():
+        match = re.search(r'\((.*?)\)\s*CSV DATA\s*\(\s*\'([^\']+)\'', statement, re.DOTALL)
+        columns = [column.strip().strip('"') for column in match.group(1).split(',')]
+        sources[table] = (columns, match.group(2).rsplit('/', 1)[-1])
+    return sources
+
+
+# Splits the tables keyed by warehouse into a range per warehouse and spreads the ranges over the cluster,
+# so that the imports write to every node from the start instead of waiting for the ranges to be rebalanced
+def splitTables(conn, warehouses):
+    conn.set_session(autocommit=True)
+    for table in WAREHOUSE_TABLES:
+        start = time.time()
+        execSqlTransaction(conn, 'ALTER TABLE "{}" SPLIT AT SELECT generate_series(2, {});'.format(table, warehouses))
+        execSqlTransaction(conn, 'ALTER TABLE "{}" SCATTER;'.format(table))
+        logging.info('Split and scattered %s in %.1fs', table, time.time() - start)
+    conn.set_session(autocommit=False)
+
+
+# Runs an IMPORT statement on a connection of its own, returning the time taken in seconds.
+# Errors are raised to the caller rather than logged, so that a failed import fails the setup.
+def importTable(hostNums, port, database, host, statement):
+    conn = connectDb(hostNums, port, database, host)
+    try:
+        conn.set_session(autocommit=True)
+        start = time.time()
+        with conn.cursor() as cur:
+            cur.execute(statement)
+        return time.time() - start
+    finally:
+        conn.close()
+
+
+# Returns the tables that could not be loaded
+def loadDataParallel(conn, hostNums, port, database, host, warehouses, workers):
+    splitTables(conn, warehouses)
+    imports = readImportStatements()
+    failed = []
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(importTable, hostNums, port, database, host, statement): table
+                   for table, statement in imports}
+        for i, future in enumerate(as_completed(futures), 1):
+            table = futures[future]
+            try:
+                logging.info('Loaded %s (%d/%d tables) in %.1fs', table, i, len(imports), future.result())
+            except psycopg2.Error as e:
+                logging.error('Could not load %s (%d/%d tables): %s', table, i, len(imports), e)
+                failed.append(table)
+    logging.info('Loaded %d/%d tables in %.1fs', len(imports) - len(failed), len(imports), time.time() - start)
+    return failed
+
+
+# Converts a csv row, where null stands for NULL as in load-data.sql, into a line of COPY text format
+def toCopyLine(row):
+    return '\t'.join('\\N' if value == 'null' else
+                     value.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+                     for value in row) + '\n'
+
+
+# Copies the chunks of rows taken from chunks into table until it gets None, returning the number of rows copied.
+# The first error of any worker is added to errors, after which the remaining chunks are taken without being
+# copied so that the producer is never blocked on a full queue.
+def copyWorker(conn, table, columns, chunks, errors):
+    copied = 0
+    sql = 'COPY "{}" ({}) FROM STDIN;'.format(table, ', '.join('"{}"'.format(column) for column in columns))
+    while True:
+        chunk = chunks.get()
+        if chunk is None:
+            return copied
+        if errors:
+            continue
+        lines, rowcount = chunk
+        try:
+            with conn.cursor() as cur:
+                cur.copy_expert(sql, io.StringIO(lines))
+            conn.commit()
+            copied += rowcount
+        except Exception as e:
+            logging.error('Could not copy %d rows into %s: %s', rowcount, table, e)
+            errors.append(e)
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                pass
+
+
+# Streams the csv file of each table in chunks of batchSize rows to workers copying them concurrently over
+# connections of their own. At most 2 chunks per worker are held in memory. The load stops at the first chunk
+# that could not be copied, raising its error.
+def loadDataCopy(hostNums, port, database, host, dataDir, batchSize, workers):
+    sources = readImportSources()
+    conns = [connectDb(hostNums, port, database, host) for _ in range(workers)]
+    start = time.time()
+    try:
+        for i, table in enumerate(COPY_ORDER, 1):
+            columns, filename = sources[table]
+            tableStart = time.time()
+            chunks = queue.Queue(2 * workers)
+            errors = []
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(copyWorker, conn, table, columns, chunks, errors) for conn in conns]
+                try:
+                    with open(os.path.join(dataDir, filename), 'r', newline='') as f:
+                        lines = []
+                        for row in csv.reader(f):
+                            lines.append(toCopyLine(row))
+                            if len(lines) == batchSize:
+                                if errors:
+                                    break
+                                chunks.put((''.join(lines), len(lines)))
+                                lines = []
+                        if lines and not errors:
+                            chunks.put((''.join(lines), len(lines)))
+                finally:
+                    for _ in futures:
+                        chunks.put(None)
+                copied = sum(future.result() for future in futures)
+            if errors:
+                raise errors[0]
+            logging.info('Copied %d rows into %s (%d/%d tables) in %.1fs', copied, table, i, len(COPY_ORDER),
+                         time.time() - tableStart)
+    finally:
+        for conn in conns:
+            conn.close()
+    logging.info('Loaded all tables in %.1fs', time.time() - start)
+
+
+# Fills the item_customer index from the loaded orders in transactions of at most ORDERS_PER_INDEX_BATCH orders
+# of a district, i.e. about 10 times as many order lines. Errors are raised, as an incomplete index would make
+# Related-Customer miss customers.
+def buildItemCustomerIndex(conn):
+    with conn.cursor() as cur:
+        cur.execute('SELECT o_w_id, o_d_id, MIN(o_id), MAX(o_id) FROM "order" GROUP BY o_w_id, o_d_id '
+                    'ORDER BY o_w_id, o_d_id;')
+        districts = cur.fetchall()
+    conn.commit()
+    start = time.time()
+    indexed = 0
+    for i, (warehouseId, districtId, minOrderId, maxOrderId) in enumerate(districts, 1):
+        for firstOrderId in range(minOrderId, maxOrderId + 1, ORDERS_PER_INDEX_BATCH):
+            try:
+                with conn.cursor() as cur:
+                    cur.execute('''
+                        UPSERT INTO item_customer (ic_i_id, ic_w_id, ic_d_id, ic_c_id, ic_o_id)
+                        SELECT ol_i_id, ol_w_id, ol_d_id, o_c_id, ol_o_id
+                        FROM orderline JOIN "order" ON ol_w_id = o_w_id AND ol_d_id = o_d_id AND ol_o_id = o_id
+                        WHERE ol_w_id = %s AND ol_d_id = %s AND ol_o_id >= %s AND ol_o_id < %s;
+                    ''', (warehouseId, districtId, firstOrderId, firstOrderId + ORDERS_PER_INDEX_BATCH))
+                    indexed += cur.rowcount
+                conn.commit()
+            except psycopg2.Error as e:
+                logging.error('Could not index the items of orders %d to %d of district (%d, %d): %s', firstOrderId,
+                              firstOrderId + ORDERS_PER_INDEX_BATCH - 1, warehouseId, districtId, e)
+                conn.rollback()
+                raise
+        logging.info('Indexed the items ordered in district (%d, %d) (%d/%d districts, %d items, %.1fs)',
+                     warehouseId, districtId, i, len(districts), indexed, time.time() - start)
+
+
+# Secondary indexes are created after the bulk load, which is faster than maintaining them during IMPORT
+def createIndexes(conn, indexProfile='default'):
+    for filename in INDEX_PROFILES[indexProfile]:
+        with open(filename, 'r') as f:
+            execSqlFromFile(conn, f)
+
+
 def dropTables(conn):
     with open('drop-tables.sql', 'r') as f:
         execSqlFromFile(conn, f)
 
 
-def connectDb(hostNum, port, database):
-    host = f'xcnc{hostNum}.comp.nus.edu.sg'
-    port = port
-    user = 'root'  # use root so we don't have to grant privileges manually
-    conn = psycopg2.connect(host=host,
-                            port=port,
-                            user=user,
-                            database=database)
-    return conn
+def connectDb(hostNums, port, database, host=None):
+    if host is not None:
+        return psycopg2.connect(host=host, port=port, user='root', database=database)
+    return pool.connect_best(hostNums, port, database)
 
 
 def setupParser():
@@ -58,8 +263,13 @@ def setupParser():
     # if hostNum not specified, use default host 2 (i.e. xcnc2)
     parser = argparse.ArgumentParser()
     parser.add_argument("-hn", '--hostNum',
-                        type=int, default=2,
-                        help='Host number e.g. 2 for xcnc2. Default is xcnc2.'
+                        type=int, nargs='+', default=[2],
+                        help='Host number(s) e.g. 2 for xcnc2. Connects to the healthy host with the lowest round '
+                             'trip time. Default is xcnc2.'
+                        )
+    parser.add_argument("-H", '--host',
+                        type=str, default=None,
+                        help='Host name to connect to instead of the xcnc hosts, e.g. localhost.'
                         )
     parser.add_argument("-p", '--port',
                         type=int, default=26260,
@@ -69,6 +279,43 @@ def setupParser():
                         type=str, default="project",
                         help='Database name. Default is "project"'
                         )
+    parser.add_argument("-s", '--schema',
+                        choices=sorted(SCHEMAS), default='default',
+                        help='Schema layout. interleaved stores the districts, customers, orders, order lines and '
+                             'stock of each warehouse within the warehouse\'s key range. Default is default.'
+                        )
+    parser.add_argument("-ip", '--indexProfile',
+                        choices=sorted(INDEX_PROFILES), default='default',
+                        help='Secondary indexes to create after loading the data. covering also creates indexes '
+                             'covering the Order-Status and Stock-Level reads, at the cost of slower New-Orders. '
+                             'Default is default.'
+                        )
+    parser.add_argument("-l", '--loader',
+                        choices=LOADERS, default=None,
+                        help='How the data is loaded. import runs the IMPORT statements of load-data.sql one after '
+                             'another. parallel splits the tables by warehouse first and runs the imports '
+                             'concurrently. copy streams the csv files in --dataDir from this machine with '
+                             'COPY FROM STDIN. Default is import, or copy with the interleaved schema, which '
+                             'cannot be loaded with IMPORT.'
+                        )
+    parser.add_argument("-w", '--workers',
+                        type=int, default=4,
+                        help='Number of concurrent imports (parallel loader) or COPY connections (copy loader). '
+                             'Default is 4.'
+                        )
+    parser.add_argument("-dd", '--dataDir',
+                        type=str, default='data-files',
+                        help='Directory of the csv files read by the copy loader. Default is data-files.'
+                        )
+    parser.add_argument("-bs", '--batchSize',
+                        type=int, default=10000,
+                        help='Number of rows sent per COPY by the copy loader. Default is 10000.'
+                        )
+    parser.add_argument("-wh", '--warehouses',
+                        type=int, default=10,
+                        help='Number of warehouses in the data, to split the tables at (parallel loader). '
+                             'Default is 10.'
+                        )
     parser.add_argument("-d", action="store_true",
                         help="Set flag to only drop tables.")
     return parser
@@ -78,16 +325,40 @@ def main():
     # Setup parser arguments
     parser = setupParser()
     args = parser.parse_args()
+    if args.loader is None:
+        args.loader = 'copy' if args.schema == 'interleaved' else 'import'
+    elif args.schema == 'interleaved' and args.loader != 'copy':
+        parser.error('IMPORT INTO does not support interleaved tables, use -l copy with -s interleaved')
 
     # Connect to DB
-    conn = connectDb(args.hostNum, args.port, args.database)
+    conn = connectDb(args.hostNum, args.port, args.database, args.host)
 
     # If -d flag was specified, drop tables only and return
     dropTables(conn)
     if args.d:
         return
-    createTables(conn)
-    loadData(conn)
+    createTables(conn, args.schema)
+    if args.loader == 'copy':
+        try:
+            loadDataCopy(args.hostNum, args.port, args.database, args.host, args.dataDir, args.batchSize,
+                         args.workers)
+        except Exception:
+            logging.exception('Setup failed, the data could not be copied')
+            sys.exit(1)
+    elif args.loader == 'parallel':
+        failed = loadDataParallel(conn, args.hostNum, args.port, args.database, args.host, args.warehouses,
+                                  args.workers)
+        if failed:
+            logging.error('Setup failed, tables not loaded: %s', ', '.join(failed))
+            sys.exit(1)
+    else:
+        loadData(conn)
+    try:
+        buildItemCustomerIndex(conn)
+    except psycopg2.Error:
+        logging.error('Setup failed, item_customer is incomplete')
+        sys.exit(1)
+    createIndexes(conn, args.indexProfile)
 
 
 if __name__ == '__main__':
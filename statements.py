@@ -0,0 +1,173 @@
+from collections import OrderedDict
+from functools import lru_cache
+import re
+import threading
+import time
+import weakref
+
+import tracing
+
+# Matches an escaped %, a named placeholder %(name)s or a positional placeholder %s
+PLACEHOLDER_PATTERN = re.compile(r"%%|%\((\w+)\)s|%s")
+
+# Maximum number of prepared statements kept per connection, 0 sends every statement as text
+max_prepared_statements = 0
+
+_caches = weakref.WeakKeyDictionary()
+_caches_lock = threading.Lock()
+
+
+def configure(max_prepared):
+    global max_prepared_statements
+    max_prepared_statements = max_prepared
+
+
+# Splits sql into its statements, and for each statement returns
+# (is_set, text with %s placeholders, keys of each %s, text with $n placeholders, keys of each $n)
+# where keys index into the params passed with sql. Statements are split naively on ';', so none of the
+# statements executed through this module may contain a ';' inside a literal.
+@lru_cache(maxsize=1024)
+def parse_statements(sql):
+    statements = []
+    position = 0
+    for text in sql.split(';'):
+        text = text.strip()
+        if not text:
+            continue
+
+        text_keys = []
+        prepared_keys = []
+        prepared_numbers = {}
+
+        def to_text(match):
+            nonlocal position
+            if match.group(0) == '%%':
+                return '%%'
+            key = match.group(1)
+            if key is None:
+                key = position
+                position += 1
+            text_keys.append(key)
+            return '%s'
+
+        def to_prepared(match):
+            if match.group(0) == '%%':
+                return '%'
+            key = next(keys)
+            if key not in prepared_numbers:
+                prepared_keys.append(key)
+                prepared_numbers[key] = "${}".format(len(prepared_keys))
+            return prepared_numbers[key]
+
+        positional_text = PLACEHOLDER_PATTERN.sub(to_text, text)
+        keys = iter(text_keys)
+        prepared_text = PLACEHOLDER_PATTERN.sub(to_prepared, text)
+        is_set = text.split(None, 1)[0].upper() == "SET"
+        statements.append((is_set, positional_text, tuple(text_keys), prepared_text, tuple(prepared_keys)))
+    return tuple(statements)
+
+
+# Server-side prepared statements of a single connection, keyed by statement text (i.e. its shape)
+# and evicted in least recently used order so that at most max_size statements are prepared
+class PreparedStatementCache:
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.statements = OrderedDict()
+        self.next_id = 0
+        # Names that may or may not be prepared after a failed batch. DEALLOCATE fails on a name that is not
+        # prepared, so they are only deallocated by a DEALLOCATE ALL, and count towards max_size until then.
+        self.unknown = set()
+
+    # Executes sql in a single round trip, preparing any statement not yet in the cache and
+    # executing all statements by name. SET statements cannot be prepared and are sent as text.
+    def execute(self, curs, sql, params=None):
+        batch = []
+        batch_params = []
+        prepared = []
+        deallocated = []
+        for is_set, positional_text, text_keys, prepared_text, prepared_keys in parse_statements(sql):
+            if is_set:
+                batch.append(positional_text)
+                batch_params.extend(params[k] for k in text_keys)
+                continue
+
+            # Once the unknown names leave no room, all statements are deallocated and prepared again on use
+            if self.unknown and len(self.statements) + len(self.unknown) >= self.max_size:
+                batch.append("DEALLOCATE ALL")
+                deallocated.extend(self.statements.values())
+                deallocated.extend(self.unknown)
+                self.statements.clear()
+                self.unknown.clear()
+
+            name = self.statements.get(prepared_text)
+            if name is None:
+                # Room is made before preparing, so that max_size is never exceeded even if the batch fails
+                if len(self.statements) + len(self.unknown) >= self.max_size:
+                    _, evicted_name = self.statements.popitem(last=False)
+                    batch.append("DEALLOCATE {}".format(evicted_name))
+                    deallocated.append(evicted_name)
+                name = "stmt_{}".format(self.next_id)
+                self.next_id += 1
+                batch.append("PREPARE {} AS {}".format(name, prepared_text.replace('%', '%%')))
+                self.statements[prepared_text] = name
+                prepared.append(prepared_text)
+            else:
+                self.statements.move_to_end(prepared_text)
+
+            if prepared_keys:
+                batch.append("EXECUTE {} ({})".format(name, ", ".join(["%s"] * len(prepared_keys))))
+                batch_params.extend(params[k] for k in prepared_keys)
+            else:
+                batch.append("EXECUTE {}".format(name))
+
+        query = "; ".join(batch) + ";"
+        try:
+            if batch_params:
+                curs.execute(query, batch_params)
+            else:
+                curs.execute(query.replace('%%', '%'))
+        except Exception:
+            # Whether the statements were prepared or deallocated is unknown, so prepare them again under a new
+            # name next time and leave the names to be deallocated
+            for prepared_text in prepared:
+                name = self.statements.pop(prepared_text, None)
+                if name is not None:
+                    self.unknown.add(name)
+            self.unknown.update(deallocated)
+            raise
+
+
+def get_cache(conn):
+    if max_prepared_statements <= 0:
+        return None
+    with _caches_lock:
+        cache = _caches.get(conn)
+        if cache is None:
+            cache = PreparedStatementCache(max_prepared_statements)
+            _caches[conn] = cache
+        return cache
+
+
+def _execute(curs, sql, params):
+    cache = get_cache(curs.connection)
+    if cache is None:
+        curs.execute(sql, params)
+    else:
+        cache.execute(curs, sql, params)
+
+
+# Executes sql with params on the cursor, through the connection's prepared statement cache if enabled.
+# label names the statement in the tracing report, defaulting to its first keyword.
+def execute(curs, sql, params=None, label=None):
+    if not tracing.enabled:
+        _execute(curs, sql, params)
+        return
+
+    label = label or sql.split(None, 1)[0].lower()
+    start = time.perf_counter()
+    try:
+        _execute(curs, sql, params)
+    except Exception:
+        tracing.record_error(label)
+        raise
+    tracing.record(label, (time.perf_counter() - start) * 1000, curs.rowcount)
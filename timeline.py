@@ -0,0 +1,54 @@
+import time
+
+# Upper bounds (in milliseconds) of the latency buckets counted per window, the last bucket counting all
+# latencies above the last bound
+LATENCY_BOUNDS_MS = [1, 5, 10, 50, 100, 500, 1000, 5000]
+
+COLUMNS = (["epoch_second", "commits", "retries"] + ["le_{}ms".format(bound) for bound in LATENCY_BOUNDS_MS] +
+           ["gt_{}ms".format(LATENCY_BOUNDS_MS[-1])])
+
+
+def latency_bucket(latency_ms):
+    for i, bound in enumerate(LATENCY_BOUNDS_MS):
+        if latency_ms <= bound:
+            return i
+    return len(LATENCY_BOUNDS_MS)
+
+
+# Counters of the transactions committed in each second (since the epoch) of a run: number of commits,
+# number of retries needed by them and their latencies in coarse buckets. Seconds without commits are not stored.
+class ThroughputTimeline:
+    def __init__(self):
+        # epoch second -> [commits, retries, count per latency bucket...]
+        self.windows = {}
+
+    def record(self, latency_ms, retries, now=None):
+        second = int(time.time() if now is None else now)
+        window = self.windows.get(second)
+        if window is None:
+            window = [0] * (len(LATENCY_BOUNDS_MS) + 3)
+            self.windows[second] = window
+        window[0] += 1
+        window[1] += retries
+        window[2 + latency_bucket(latency_ms)] += 1
+
+    # Writes one line of comma separated values per second, in time order
+    def write(self, filename):
+        with open(filename, "w") as f:
+            f.write(",".join(COLUMNS) + "\n")
+            for second, window in sorted(self.windows.items()):
+                f.write(",".join(str(x) for x in [second] + window) + "\n")
+
+
+# Returns {epoch second: [commits, retries, count per latency bucket...]} from a file written by
+# ThroughputTimeline.write
+def read_timeline(filename):
+    windows = {}
+    with open(filename, "r") as f:
+        header = f.readline().strip().split(",")
+        if header != COLUMNS:
+            raise ValueError("{} was written with different timeline columns".format(filename))
+        for line in f:
+            values = [int(x) for x in line.strip().split(",")]
+            windows[values[0]] = values[1:]
+    return windows
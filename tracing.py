@@ -0,0 +1,70 @@
+import threading
+
+# Set with enable(), statements are only timed when tracing is enabled
+enabled = False
+
+# Transaction type and attempt number of the transaction running on the current thread
+_context = threading.local()
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+class StatementStats:
+    def __init__(self):
+        self.executions = 0
+        self.retried_executions = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+# Called before every attempt of a transaction, attempt 0 being the first
+def begin_attempt(transaction_type, attempt):
+    if not enabled:
+        return
+    _context.transaction_type = transaction_type
+    _context.attempt = attempt
+
+
+def _get_stats(label):
+    key = (getattr(_context, "transaction_type", None), label)
+    stats = _stats.get(key)
+    if stats is None:
+        stats = StatementStats()
+        _stats[key] = stats
+    return stats
+
+
+def record(label, elapsed_ms, rowcount):
+    with _stats_lock:
+        stats = _get_stats(label)
+        stats.executions += 1
+        if getattr(_context, "attempt", 0) > 0:
+            stats.retried_executions += 1
+        stats.total_ms += elapsed_ms
+        stats.max_ms = max(stats.max_ms, elapsed_ms)
+        stats.rows += max(rowcount, 0)
+
+
+def record_error(label):
+    with _stats_lock:
+        _get_stats(label).errors += 1
+
+
+# Writes the statement breakdown per transaction type in comma separated values form
+def write_report(filename):
+    with open(filename, "w") as f:
+        f.write("transaction_type,statement,executions,retried_executions,errors,total_ms,avg_ms,max_ms,avg_rows\n")
+        with _stats_lock:
+            for (transaction_type, label), stats in sorted(_stats.items(), key=lambda x: (str(x[0][0]), x[0][1])):
+                executions = max(stats.executions, 1)
+                f.write("{},{},{},{},{},{:.3f},{:.3f},{:.3f},{:.2f}\n".format(
+                    transaction_type, label, stats.executions, stats.retried_executions, stats.errors,
+                    stats.total_ms, stats.total_ms / executions, stats.max_ms, stats.rows / executions))
@@ -1,30 +1,41 @@
 from abc import ABC, abstractmethod
+from collections import Counter
 from datetime import datetime, timedelta
-import sys
+import threading
+
+import queries
+import refcache
+import statements
+
 
 # Returns "(%s, %s, ...), (%s, %s, ...)" meant to be used for VALUES
 # args determines number of args in each row
 # rows determines number of rows for VALUES
-from psycopg2.extras import execute_batch
-
-
 def create_values_placeholder(args, rows):
     single_row = "(" + ("%s," * args)[:-1] + "),"
     return (single_row * rows)[:-1]
 
 
 class Transaction(ABC):
+    # Whether the transaction can be retried from a savepoint, which is not possible for transactions
+    # that must begin with SET TRANSACTION AS OF SYSTEM TIME
+    savepoint_retry = True
+    # Whether the transaction only reads, so that it can be rerun when the result of its commit is unknown
+    read_only = False
+
     def __init__(self):
         self.inputs = {}
         self.outputs = {}
 
-    def print_outputs(self):
-        for k, v in self.outputs.items():
-            sys.stdout.write("{}: {}\n".format(k, v))
+    # Runs the transaction's statements in a transaction of its own, committing on success
+    def run(self):
+        with self.conn:
+            with self.conn.cursor() as curs:
+                self.execute(curs)
 
-    # To be implemented by subclasses
+    # To be implemented by subclasses, executes the statements of the transaction with the given cursor
     @abstractmethod
-    def run(self):
+    def execute(self, curs):
         return NotImplementedError
 
 
@@ -48,145 +59,127 @@ class NewOrderTransaction(Transaction):
             }
             self.items[new_item["item_no"]] = new_item
 
-    def run(self):
-        with self.conn:
-            with self.conn.cursor() as curs:
-                # Fetch next order id and district information, updating next order id
-                curs.execute(
-                    """
-                    UPDATE district 
-                    SET d_next_o_id = d_next_o_id + 1
-                    WHERE d_w_id=%s AND d_id=%s
-                    RETURNING d_next_o_id, d_tax;
-                    """,
-                    (self.warehouse_id, self.district_id))
-                next_order_id, district_tax = curs.fetchone()
-                order_id = next_order_id - 1
-
-                # Create new order entry
-                all_local = 1 if all(
-                    [x["supplying_warehouse_no"] == self.warehouse_id for x in self.items.values()]) else 0
-                entry_date = datetime.utcnow()
-                curs.execute("INSERT INTO \"order\" VALUES (%s, %s, %s, %s, %s, %s, %s, %s);", (
-                    self.warehouse_id, self.district_id, order_id, self.customer_id, None, len(
-                        self.items), all_local,
-                    entry_date))
-
-                # Retrieve stock information for items
-                total_amount = 0
-                district_field = "s_dist_" + str(self.district_id).zfill(2)
-                values_placeholder = create_values_placeholder(
-                    2, len(self.items))
-                stock_keys = []
-                for item in self.items.values():
-                    stock_keys.append((district_field, self.warehouse_id, item["item_no"]))
-
-                stocks = []
-                for stock_key in stock_keys:
-                    curs.execute(
-                        """
-                        SELECT s_w_id, s_i_id, s_quantity, s_ytd, s_order_cnt, s_remote_cnt, %s 
-                        FROM stock 
-                        WHERE s_w_id = %s AND s_i_id = %s;
-                        """,
-                        stock_key)
-                    res = curs.fetchone()
-                    if res:
-                        stocks.append(res)
-
-                updated_stocks = []
-                for stock in stocks:
-                    wh_id, i_id, qty, ytd, order_cnt, remote_cnt, dist_info = stock
-                    order_qty = self.items[i_id]["quantity"]
-                    supply_warehouse_id = self.items[i_id]["supplying_warehouse_no"]
-
-                    new_qty = qty - order_qty
-                    if new_qty < 10:
-                        new_qty += 100
-                    new_remote_cnt = remote_cnt
-                    if supply_warehouse_id != self.warehouse_id:
-                        new_remote_cnt += 1
-
-                    updated_stocks.append(
-                        (wh_id, i_id, new_qty, ytd + order_qty, order_cnt + 1, new_remote_cnt, dist_info))
-                    # Keep relevant info for item
-                    self.items[i_id]["stocks"] = {
-                        "quantity": new_qty,
-                        "dist_info": dist_info,
-                    }
-
-                # Update stock information for items (use upsert for single update)
-                values_placeholder = create_values_placeholder(
-                    6, len(updated_stocks))
-                updated_stocks_vals = []
-                for stock in updated_stocks:
-                    updated_stocks_vals.extend(stock[:-1])
-                curs.execute(
-                    "UPSERT INTO stock (s_w_id, s_i_id, s_quantity, s_ytd, s_order_cnt, s_remote_cnt) VALUES " +
-                    values_placeholder + ";",
-                    updated_stocks_vals)
-
-                # Retrieve item information, track item costs for order
-                values_placeholder = create_values_placeholder(
-                    len(self.items), 1)
-                curs.execute("SELECT i_id, i_name, i_price FROM item WHERE i_id IN " + values_placeholder + ";",
-                             list(self.items.keys()))
-                items = curs.fetchall()
-                for item in items:
-                    i_id, name, price = item
-                    self.items[i_id]["cost"] = price * \
-                                               self.items[i_id]["quantity"]
-                    self.items[i_id]["name"] = name
-                    total_amount += self.items[i_id]["cost"]
-
-                # Add new order lines
-                values_placeholder = create_values_placeholder(
-                    10, len(self.items))
-                new_order_lines = []
-                for item in self.items.values():
-                    new_order_lines.extend([self.warehouse_id, self.district_id, order_id, item["ol_number"],
-                                            item["item_no"], None, item["cost"], item["supplying_warehouse_no"],
-                                            item["quantity"], item["stocks"]["dist_info"]])
-                curs.execute("INSERT INTO orderline VALUES " +
-                             values_placeholder + ";", new_order_lines)
-
-                # Retrieve user information
-                curs.execute(
-                    "SELECT c_last, c_credit, c_discount FROM customer WHERE c_w_id=%s AND c_d_id=%s AND c_id=%s;",
-                    (self.warehouse_id, self.district_id, self.customer_id))
-                last_name, credit, discount = curs.fetchone()
-
-                # Retrieve warehouse tax
-                curs.execute(
-                    "SELECT w_tax FROM warehouse WHERE w_id=%s;", (self.warehouse_id,))
-                warehouse_tax = curs.fetchone()[0]
-
-                # Calculate total amount
-                total_amount = total_amount * \
-                               (1 + district_tax + warehouse_tax) * (1 - discount)
-
-                # Add to output dict
-                self.outputs["Customer identifier"] = "({}, {}, {})".format(self.warehouse_id, self.district_id,
-                                                                            self.customer_id)
-                self.outputs["Customer last name"] = last_name
-                self.outputs["Customer credit"] = credit
-                self.outputs["Customer discount"] = discount
-                self.outputs["Warehouse tax rate"] = warehouse_tax
-                self.outputs["District tax rate"] = district_tax
-                self.outputs["Order number"] = order_id
-                self.outputs["Entry date"] = entry_date
-                self.outputs["Num items"] = len(self.items)
-                self.outputs["Total amount"] = total_amount
-                order_items = []
-                for item in self.items.values():
-                    order_item = {"number": item["item_no"],
-                                  "name": item["name"],
-                                  "supplying_warehouse": item["supplying_warehouse_no"],
-                                  "quantity": item["quantity"],
-                                  "price": item["cost"],
-                                  "remaining_stock": item["stocks"]["quantity"]}
-                    order_items.append(order_item)
-                self.outputs["Items"] = order_items
+    def execute(self, curs):
+        # Fetch next order id and district tax, updating next order id, together with customer
+        # information and the warehouse tax if it is not cached
+        warehouse_tax = refcache.cache.get_warehouse_tax(self.warehouse_id)
+        read_warehouse_tax = warehouse_tax is None
+        statements.execute(curs,
+            """
+            WITH updated_district AS (
+                UPDATE district
+                SET d_next_o_id = d_next_o_id + 1
+                WHERE d_w_id=%s AND d_id=%s
+                RETURNING d_next_o_id, d_tax
+            )
+            SELECT d_next_o_id, d_tax, c_last, c_credit, c_discount""" +
+            (", w_tax FROM updated_district, customer, warehouse WHERE w_id=%s AND"
+             if read_warehouse_tax else " FROM updated_district, customer WHERE") +
+            """ c_w_id=%s AND c_d_id=%s AND c_id=%s;
+            """,
+            [self.warehouse_id, self.district_id] + ([self.warehouse_id] if read_warehouse_tax else []) +
+            [self.warehouse_id, self.district_id, self.customer_id], label="update_district")
+        next_order_id, district_tax, last_name, credit, discount, *warehouse = curs.fetchone()
+        if read_warehouse_tax:
+            warehouse_tax = warehouse[0]
+            refcache.cache.put_warehouse_tax(self.warehouse_id, warehouse_tax)
+        order_id = next_order_id - 1
+
+        # Retrieve stock information for all items at once, along with item information if not cached
+        item_info = refcache.cache.get_items(self.items.keys())
+        read_items = len(item_info) < len(self.items)
+        district_field = "s_dist_" + str(self.district_id).zfill(2)
+        values_placeholder = create_values_placeholder(
+            len(self.items), 1)
+        statements.execute(curs,
+            "SELECT s_i_id, s_quantity, s_ytd, s_order_cnt, s_remote_cnt, " + district_field +
+            (", i_name, i_price FROM stock JOIN item ON i_id = s_i_id" if read_items else " FROM stock") +
+            " WHERE s_w_id = %s AND s_i_id IN " + values_placeholder + ";",
+            [self.warehouse_id, *self.items.keys()], label="read_stock")
+        stocks = curs.fetchall()
+        if read_items:
+            for stock in stocks:
+                i_id, *_, name, price = stock
+                item_info[i_id] = (name, price)
+                refcache.cache.put_item(i_id, name, price)
+
+        # Compute updated stock information, track item costs for order
+        total_amount = 0
+        updated_stocks_vals = []
+        for stock in stocks:
+            i_id, qty, ytd, order_cnt, remote_cnt, dist_info = stock[:6]
+            name, price = item_info[i_id]
+            order_qty = self.items[i_id]["quantity"]
+            supply_warehouse_id = self.items[i_id]["supplying_warehouse_no"]
+
+            new_qty = qty - order_qty
+            if new_qty < 10:
+                new_qty += 100
+            new_remote_cnt = remote_cnt
+            if supply_warehouse_id != self.warehouse_id:
+                new_remote_cnt += 1
+
+            updated_stocks_vals.extend(
+                [self.warehouse_id, i_id, new_qty, ytd + order_qty, order_cnt + 1, new_remote_cnt])
+            # Keep relevant info for item
+            self.items[i_id]["stocks"] = {
+                "quantity": new_qty,
+                "dist_info": dist_info,
+            }
+            self.items[i_id]["cost"] = price * order_qty
+            self.items[i_id]["name"] = name
+            total_amount += self.items[i_id]["cost"]
+
+        # Create new order entry, update stock information (use upsert for single update),
+        # add new order lines and index the ordered items by customer in a single round trip
+        all_local = 1 if all(
+            [x["supplying_warehouse_no"] == self.warehouse_id for x in self.items.values()]) else 0
+        entry_date = datetime.utcnow()
+        new_order = [self.warehouse_id, self.district_id, order_id, self.customer_id, None, len(self.items),
+                     all_local, entry_date]
+        new_order_lines = []
+        for item in self.items.values():
+            new_order_lines.extend([self.warehouse_id, self.district_id, order_id, item["ol_number"],
+                                    item["item_no"], None, item["cost"], item["supplying_warehouse_no"],
+                                    item["quantity"], item["stocks"]["dist_info"]])
+        new_item_customers = []
+        for item in self.items.values():
+            new_item_customers.extend([item["item_no"], self.warehouse_id, self.district_id, self.customer_id,
+                                       order_id])
+        statements.execute(curs,
+            "INSERT INTO \"order\" VALUES " + create_values_placeholder(8, 1) + ";" +
+            "UPSERT INTO stock (s_w_id, s_i_id, s_quantity, s_ytd, s_order_cnt, s_remote_cnt) VALUES " +
+            create_values_placeholder(6, len(stocks)) + ";" +
+            "INSERT INTO orderline VALUES " + create_values_placeholder(10, len(self.items)) + ";" +
+            "INSERT INTO item_customer VALUES " + create_values_placeholder(5, len(self.items)) + ";",
+            new_order + updated_stocks_vals + new_order_lines + new_item_customers, label="write_order")
+
+        # Calculate total amount
+        total_amount = total_amount * \
+                       (1 + district_tax + warehouse_tax) * (1 - discount)
+
+        # Add to output dict
+        self.outputs["Customer identifier"] = "({}, {}, {})".format(self.warehouse_id, self.district_id,
+                                                                    self.customer_id)
+        self.outputs["Customer last name"] = last_name
+        self.outputs["Customer credit"] = credit
+        self.outputs["Customer discount"] = discount
+        self.outputs["Warehouse tax rate"] = warehouse_tax
+        self.outputs["District tax rate"] = district_tax
+        self.outputs["Order number"] = order_id
+        self.outputs["Entry date"] = entry_date
+        self.outputs["Num items"] = len(self.items)
+        self.outputs["Total amount"] = total_amount
+        order_items = []
+        for item in self.items.values():
+            order_item = {"number": item["item_no"],
+                          "name": item["name"],
+                          "supplying_warehouse": item["supplying_warehouse_no"],
+                          "quantity": item["quantity"],
+                          "price": item["cost"],
+                          "remaining_stock": item["stocks"]["quantity"]}
+            order_items.append(order_item)
+        self.outputs["Items"] = order_items
 
 
 class PaymentTransaction(Transaction):
@@ -198,60 +191,68 @@ class PaymentTransaction(Transaction):
         self.customer_id = int(inputs[2])
         self.payment = float(inputs[3])
 
-    def run(self):
-        with self.conn:
-            with self.conn.cursor() as curs:
-                # Fetch and update warehouse details
-                curs.execute(
-                    """
-                    UPDATE warehouse SET w_ytd = w_ytd + %s
-                    WHERE w_id=%s
-                    RETURNING w_street_1, w_street_2, w_city, w_state, w_zip;
-                    """,
-                    (self.payment, self.warehouse_id))
-                w_street1, w_street2, w_city, w_state, w_zip = curs.fetchone()
-
-                # Fetch and update district details
-                curs.execute(
-                    """
-                    UPDATE district
-                    SET d_ytd = d_ytd + %s
-                    WHERE d_w_id=%s AND d_id=%s
-                    RETURNING d_street_1, d_street_2, d_city, d_state, d_zip
-                    """,
-                    (self.payment, self.warehouse_id, self.district_id))
-                d_street1, d_street2, d_city, d_state, d_zip = curs.fetchone()
-
-                # Fetch and update customer details
-                curs.execute(
-                    """
-                    UPDATE customer
-                    SET c_balance = c_balance - %s, c_ytd_payment = c_ytd_payment + %s, c_payment_cnt = c_payment_cnt + 1
-                    WHERE c_w_id=%s AND c_d_id=%s AND c_id=%s
-                    RETURNING c_first, c_middle, c_last, c_street_1, c_street_2, c_city, c_state, c_zip, c_phone, 
-                    c_since, c_credit, c_credit_lim, c_discount, c_balance;
-                    """,
-                    (self.payment, self.payment, self.warehouse_id, self.district_id, self.customer_id))
-                first_name, middle_name, last_name, c_street1, c_street2, c_city, c_state, c_zip, c_phone, c_since, c_credit, c_credit_lim, c_discount, c_balance = curs.fetchone()
-
-                # Add to output dict
-                self.outputs["Customer identifier"] = "({}, {}, {})".format(self.warehouse_id, self.district_id,
-                                                                            self.customer_id)
-                self.outputs["Customer name"] = "{} {} {}".format(
-                    first_name, middle_name, last_name)
-                self.outputs["Customer address"] = "{} {} {} {} {}".format(
-                    c_street1, c_street2, c_city, c_state, c_zip)
-                self.outputs["Customer phone"] = c_phone
-                self.outputs["Customer creation date"] = c_since
-                self.outputs["Customer credit"] = c_credit
-                self.outputs["Customer credit limit"] = c_credit_lim
-                self.outputs["Customer discount"] = c_discount
-                self.outputs["Customer balance"] = c_balance
-                self.outputs["Warehouse address"] = "{} {} {} {} {}".format(w_street1, w_street2, w_city, w_state,
-                                                                            w_zip)
-                self.outputs["District address"] = "{} {} {} {} {}".format(
-                    d_street1, d_street2, d_city, d_state, d_zip)
-                self.outputs["Payment"] = self.payment
+    def execute(self, curs):
+        # Fetch and update warehouse details
+        statements.execute(curs,
+            """
+            UPDATE warehouse SET w_ytd = w_ytd + %s
+            WHERE w_id=%s
+            RETURNING w_street_1, w_street_2, w_city, w_state, w_zip;
+            """,
+            (self.payment, self.warehouse_id), label="update_warehouse")
+        w_street1, w_street2, w_city, w_state, w_zip = curs.fetchone()
+
+        # Fetch and update district details
+        statements.execute(curs,
+            """
+            UPDATE district
+            SET d_ytd = d_ytd + %s
+            WHERE d_w_id=%s AND d_id=%s
+            RETURNING d_street_1, d_street_2, d_city, d_state, d_zip
+            """,
+            (self.payment, self.warehouse_id, self.district_id), label="update_district")
+        d_street1, d_street2, d_city, d_state, d_zip = curs.fetchone()
+
+        # Fetch and update customer details
+        statements.execute(curs,
+            """
+            UPDATE customer
+            SET c_balance = c_balance - %s, c_ytd_payment = c_ytd_payment + %s, c_payment_cnt = c_payment_cnt + 1
+            WHERE c_w_id=%s AND c_d_id=%s AND c_id=%s
+            RETURNING c_first, c_middle, c_last, c_street_1, c_street_2, c_city, c_state, c_zip, c_phone, 
+            c_since, c_credit, c_credit_lim, c_discount, c_balance;
+            """,
+            (self.payment, self.payment, self.warehouse_id, self.district_id, self.customer_id),
+            label="update_customer")
+        first_name, middle_name, last_name, c_street1, c_street2, c_city, c_state, c_zip, c_phone, c_since, c_credit, c_credit_lim, c_discount, c_balance = curs.fetchone()
+
+        # Add to output dict
+        self.outputs["Customer identifier"] = "({}, {}, {})".format(self.warehouse_id, self.district_id,
+                                                                    self.customer_id)
+        self.outputs["Customer name"] = "{} {} {}".format(
+            first_name, middle_name, last_name)
+        self.outputs["Customer address"] = "{} {} {} {} {}".format(
+            c_street1, c_street2, c_city, c_state, c_zip)
+        self.outputs["Customer phone"] = c_phone
+        self.outputs["Customer creation date"] = c_since
+        self.outputs["Customer credit"] = c_credit
+        self.outputs["Customer credit limit"] = c_credit_lim
+        self.outputs["Customer discount"] = c_discount
+        self.outputs["Customer balance"] = c_balance
+        self.outputs["Warehouse address"] = "{} {} {} {} {}".format(w_street1, w_street2, w_city, w_state,
+                                                                    w_zip)
+        self.outputs["District address"] = "{} {} {} {} {}".format(
+            d_street1, d_street2, d_city, d_state, d_zip)
+        self.outputs["Payment"] = self.payment
+
+
+# Oldest undelivered order of each of the 10 districts of a warehouse. Each district is read with LIMIT 1 so
+# that only the first undelivered order is read, not the newest orders where NewOrder inserts
+OLDEST_UNDELIVERED_ORDERS = "\n                UNION ALL\n                ".join(
+    """(SELECT o_w_id, o_d_id, o_id FROM "order"
+                WHERE o_w_id = %s AND o_d_id = {} AND o_carrier_id IS NULL
+                ORDER BY o_id
+                LIMIT 1)""".format(district_id) for district_id in range(1, 11))
 
 
 class DeliveryTransaction(Transaction):
@@ -261,82 +262,61 @@ class DeliveryTransaction(Transaction):
         self.warehouse_id = int(inputs[0])
         self.carrier_id = int(inputs[1])
 
-    def run(self):
-        with self.conn:
-            with self.conn.cursor() as curs:
-
-                orders = []
-                for i in range(1, 11):
-                    curs.execute(
-                        """
-                        SELECT o_w_id, o_d_id, o_id, o_c_id FROM "order"
-                        WHERE o_w_id = %s AND o_d_id = %s
-                        AND o_carrier_id IS NULL
-                        ORDER BY o_id
-                        LIMIT 1
-                        """, (self.warehouse_id, i))
-
-                    res = curs.fetchone()
-                    if res:
-                        orders.append(res)
-
-                order_keys = []
-                for order in orders:
-                    order_keys.append(order[:3])
-
-                # Only process if there are orders to deliver on
-                if len(order_keys) > 0:
-                    # Update orders
-                    customer_balance = {}
-                    order_customer_mapping = {}
-                    for order in orders:
-                        customer_id = (*order[:2], order[3])
-                        order_customer_mapping[tuple(order[:3])] = customer_id
-                        customer_balance[customer_id] = 0
-
-                    execute_batch(curs,
-                                  """
-                                  UPDATE "order" 
-                                  SET o_carrier_id=%s WHERE o_w_id = %s AND o_d_id = %s AND o_id = %s;
-                                  """,
-                                  [[self.carrier_id, *order_key] for order_key in order_keys])
-
-                    # Update order lines and fetch order amounts
-                    order_lines = []
-                    delivery_date = datetime.utcnow()
-                    for order_key in order_keys:
-                        curs.execute(
-                            """
-                            UPDATE orderline 
-                            SET ol_delivery_d = %s 
-                            WHERE ol_w_id = %s AND ol_d_id = %s AND ol_o_id = %s
-                            RETURNING ol_w_id, ol_d_id, ol_o_id, ol_number, ol_amount;
-                            """,
-                            (delivery_date, *order_key))
-                        res = curs.fetchone()
-                        if res:
-                            order_lines.append(res)
-
-                    for order_line in order_lines:
-                        customer_id = order_customer_mapping[tuple(order_line[:3])]
-                        customer_balance[customer_id] += order_line[-1]
-
-                    # Update customers
-                    updated_customers = []
-                    for customer_id, balance_addition in customer_balance.items():
-                        updated_customers.append((balance_addition, *customer_id))
-
-                    execute_batch(curs,
-                                  """
-                                  UPDATE customer
-                                  SET c_delivery_cnt = c_delivery_cnt + 1,
-                                  c_balance = c_balance + %s
-                                  WHERE c_w_id = %s AND c_d_id = %s AND c_id = %s;
-                                  """,
-                                  updated_customers)
+    def execute(self, curs):
+        # Assign carrier to the oldest undelivered order of every district at once
+        statements.execute(curs,
+            """
+            UPDATE "order"
+            SET o_carrier_id = %s
+            WHERE (o_w_id, o_d_id, o_id) IN (
+                """ + OLDEST_UNDELIVERED_ORDERS + """
+            )
+            RETURNING o_d_id, o_id, o_c_id;
+            """, (self.carrier_id, *[self.warehouse_id] * 10), label="update_order")
+        orders = curs.fetchall()
+
+        # Only process if there are orders to deliver on
+        if len(orders) > 0:
+            # Update order lines and sum up the amount of each order
+            delivery_date = datetime.utcnow()
+            order_keys = []
+            for o_d_id, o_id, _ in orders:
+                order_keys.extend([o_d_id, o_id])
+            statements.execute(curs,
+                """
+                WITH delivered_order_lines AS (
+                    UPDATE orderline
+                    SET ol_delivery_d = %s
+                    WHERE ol_w_id = %s AND (ol_d_id, ol_o_id) IN (""" +
+                create_values_placeholder(2, len(orders)) + """)
+                    RETURNING ol_d_id, ol_o_id, ol_amount
+                )
+                SELECT ol_d_id, ol_o_id, SUM(ol_amount)
+                FROM delivered_order_lines
+                GROUP BY ol_d_id, ol_o_id;
+                """,
+                [delivery_date, self.warehouse_id, *order_keys], label="update_orderline")
+            order_amounts = {(o_d_id, o_id): amount for o_d_id, o_id, amount in curs.fetchall()}
+
+            # Update customers
+            updated_customers = []
+            for o_d_id, o_id, o_c_id in orders:
+                updated_customers.extend([o_d_id, o_c_id, order_amounts.get((o_d_id, o_id), 0)])
+            statements.execute(curs,
+                """
+                UPDATE customer
+                SET c_delivery_cnt = c_delivery_cnt + 1,
+                c_balance = c_balance + delivered.amount
+                FROM (VALUES """ + ", ".join(["(%s::INT, %s::INT, %s::DECIMAL)"] * len(orders)) + """)
+                AS delivered (d_id, c_id, amount)
+                WHERE c_w_id = %s AND c_d_id = delivered.d_id AND c_id = delivered.c_id;
+                """,
+                [*updated_customers, self.warehouse_id], label="update_customer")
 
 
 class OrderStatusTransaction(Transaction):
+    read_only = True
+
     def __init__(self, conn, inputs):
         super().__init__()
         self.conn = conn
@@ -344,53 +324,53 @@ class OrderStatusTransaction(Transaction):
         self.district_id = int(inputs[1])
         self.customer_id = int(inputs[2])
 
-    def run(self):
-        with self.conn:
-            with self.conn.cursor() as curs:
-
-                # Fetch customer information
-                curs.execute(
-                    """
-                    SELECT c_first, c_middle, c_last, c_balance, o_id
-                    FROM customer 
-                    JOIN "order"
-                    ON o_w_id = c_w_id AND o_d_id = c_d_id AND o_c_id = c_id
-                    WHERE c_w_id=%s AND c_d_id=%s AND c_id=%s
-                    ORDER BY o_id DESC
-                    LIMIT 1;
-                    """,
-                    (self.warehouse_id, self.district_id, self.customer_id))
-                first_name, middle_name, last_name, balance, last_o_id = curs.fetchone()
-
-                # Fetch items in last order
-                curs.execute(
-                    """
-                    SELECT o_id, o_entry_d, o_carrier_id, ol_i_id, ol_supply_w_id, ol_quantity, ol_amount, ol_delivery_d 
-                    FROM "order" 
-                    JOIN orderline ON ol_w_id = o_w_id AND ol_d_id = o_d_id AND ol_o_id = o_id  
-                    WHERE o_w_id=%s AND o_d_id=%s AND o_id=%s;
-                    """,
-                    (self.warehouse_id, self.district_id, last_o_id))
-                items = curs.fetchall()
-
-                # Add to output
-                self.outputs["Customer name"] = "{} {} {}".format(
-                    first_name, middle_name, last_name)
-                self.outputs["Customer balance"] = balance
-
-                if len(items) > 0:
-                    order_name = "Order {}".format(items[0][0])
-                    self.outputs[order_name] = "ordered at {} with carrier {}".format(
-                        items[0][1], items[0][2])
-                order_items = []
-                for item in items:
-                    order_item = {"number": item[3], "supplying_warehouse": item[4], "quantity": item[5],
-                                  "price": item[6], "delivery_date": item[7]}
-                    order_items.append(order_item)
-                self.outputs["Order items"] = order_items
+    def execute(self, curs):
+
+        # Fetch customer information
+        statements.execute(curs,
+            """
+            SELECT c_first, c_middle, c_last, c_balance, o_id
+            FROM customer 
+            JOIN "order"
+            ON o_w_id = c_w_id AND o_d_id = c_d_id AND o_c_id = c_id
+            WHERE c_w_id=%s AND c_d_id=%s AND c_id=%s
+            ORDER BY o_id DESC
+            LIMIT 1;
+            """,
+            (self.warehouse_id, self.district_id, self.customer_id), label="read_last_order")
+        first_name, middle_name, last_name, balance, last_o_id = curs.fetchone()
+
+        # Fetch items in last order
+        statements.execute(curs,
+            """
+            SELECT o_id, o_entry_d, o_carrier_id, ol_i_id, ol_supply_w_id, ol_quantity, ol_amount, ol_delivery_d 
+            FROM "order" 
+            JOIN orderline ON ol_w_id = o_w_id AND ol_d_id = o_d_id AND ol_o_id = o_id  
+            WHERE o_w_id=%s AND o_d_id=%s AND o_id=%s;
+            """,
+            (self.warehouse_id, self.district_id, last_o_id), label="read_order_lines")
+        items = curs.fetchall()
+
+        # Add to output
+        self.outputs["Customer name"] = "{} {} {}".format(
+            first_name, middle_name, last_name)
+        self.outputs["Customer balance"] = balance
+
+        if len(items) > 0:
+            order_name = "Order {}".format(items[0][0])
+            self.outputs[order_name] = "ordered at {} with carrier {}".format(
+                items[0][1], items[0][2])
+        order_items = []
+        for item in items:
+            order_item = {"number": item[3], "supplying_warehouse": item[4], "quantity": item[5],
+                          "price": item[6], "delivery_date": item[7]}
+            order_items.append(order_item)
+        self.outputs["Order items"] = order_items
 
 
 class StockLevelTransaction(Transaction):
+    read_only = True
+
     def __init__(self, conn, inputs):
         super().__init__()
         self.conn = conn
@@ -399,31 +379,61 @@ class StockLevelTransaction(Transaction):
         self.stock_threshold = int(inputs[2])
         self.num_last_orders = int(inputs[3])
 
-    def run(self):
-        with self.conn:
-            with self.conn.cursor() as curs:
-                # Read next order number for district
-                curs.execute("SELECT d_next_o_id FROM district WHERE d_w_id=%s AND d_id=%s;",
-                             (self.warehouse_id, self.district_id))
-                next_order_id = curs.fetchone()[0]
-
-                # Count number of items with stock below threshold
-                curs.execute(
-                    """
-                    SELECT COUNT(s_i_id) 
-                    FROM orderline 
-                    JOIN stock ON ol_i_id = s_i_id AND ol_w_id = s_w_id 
-                    WHERE ol_w_id=%s AND ol_d_id=%s AND s_quantity < %s AND ol_o_id >= %s AND ol_o_id < %s;
-                    """,
-                    (self.warehouse_id, self.district_id, self.stock_threshold, next_order_id - self.num_last_orders,
-                     next_order_id))
-                num_items = curs.fetchone()[0]
-
-                # Add to output
-                self.outputs["Number of items below stock threshold"] = num_items
+    def execute(self, curs):
+        # Read next order number for district
+        statements.execute(curs, "SELECT d_next_o_id FROM district WHERE d_w_id=%s AND d_id=%s;",
+                           (self.warehouse_id, self.district_id), label="read_district")
+        next_order_id = curs.fetchone()[0]
+
+        # Count number of items with stock below threshold
+        statements.execute(curs,
+            """
+            SELECT COUNT(s_i_id) 
+            FROM orderline 
+            JOIN stock ON ol_i_id = s_i_id AND ol_w_id = s_w_id 
+            WHERE ol_w_id=%s AND ol_d_id=%s AND s_quantity < %s AND ol_o_id >= %s AND ol_o_id < %s;
+            """,
+            (self.warehouse_id, self.district_id, self.stock_threshold, next_order_id - self.num_last_orders,
+             next_order_id), label="count_low_stock")
+        num_items = curs.fetchone()[0]
+
+        # Add to output
+        self.outputs["Number of items below stock threshold"] = num_items
+
+
+# Orders examined by Popular-Item with their popular items, per (warehouse, district), shared by all sessions.
+# Orders and their order lines are never modified once their transaction has committed, so a window of the last
+# orders only has to be extended with the orders created since it was cached.
+class OrderWindowCache:
+    def __init__(self):
+        # (warehouse id, district id) -> (first order id, next order id, {order id: order})
+        self.windows = {}
+        self.lock = threading.Lock()
+
+    # Returns the cached orders within [first_order_id, next_order_id) and the range of order ids that still
+    # has to be fetched, the whole window if the cached one does not cover its start
+    def get(self, key, first_order_id, next_order_id):
+        with self.lock:
+            window = self.windows.get(key)
+        if window is None or first_order_id < window[0]:
+            return {}, first_order_id
+        cached_first, cached_next, cached_orders = window
+        orders = {o_id: order for o_id, order in cached_orders.items() if first_order_id <= o_id < next_order_id}
+        return orders, max(cached_next, first_order_id)
+
+    def put(self, key, first_order_id, next_order_id, orders):
+        with self.lock:
+            window = self.windows.get(key)
+            if window is None or next_order_id >= window[1]:
+                self.windows[key] = (first_order_id, next_order_id, orders)
+
+
+order_window_cache = OrderWindowCache()
 
 
 class PopularItemTransaction(Transaction):
+    read_only = True
+
     def __init__(self, conn, inputs):
         super().__init__()
         self.conn = conn
@@ -431,81 +441,70 @@ class PopularItemTransaction(Transaction):
         self.district_id = int(inputs[1])
         self.num_last_orders = int(inputs[2])
 
-    def run(self):
-        with self.conn:
-            with self.conn.cursor() as curs:
-                with open('popular-item.sql', 'r') as f:
-                    popular_items_query = f.read()
-
-                    # Get all orders with popular items
-                    curs.execute(popular_items_query, {
-                        "input_warehouse_id": self.warehouse_id,
-                        "input_district_id": self.district_id,
-                        "input_num_last_orders": self.num_last_orders
-                    })
-                    orders = curs.fetchall()
-
-                    # Dictionaries to store output
-                    order_map = {}
-                    pop_item_statistics = {}
-
-                    # Store order info and popular items for each order
-                    for x in orders:
-                        order_id = x[0]
-                        order_entry_date = x[1]
-                        c_first = x[2]
-                        c_middle = x[3]
-                        c_last = x[4]
-                        item_name = x[5]
-                        quantity = x[6]
-                        if order_id not in order_map:
-                            order_map[order_id] = {
-                                "order_id": order_id,
-                                "order_entry_date": order_entry_date,
-                                "c_first": c_first,
-                                "c_middle": c_middle,
-                                "c_last": c_last,
-                                "pop_items": {}
-                            }
-                        order_map[order_id]['pop_items'][item_name] = quantity
-                        pop_item_statistics[item_name] = 0
-
-                    # Store percentage of orders that contain each popular item
-                    total_orders = len(order_map)
-                    for key in pop_item_statistics:
-                        num_containing_orders = 0
-                        for _, value in order_map.items():
-                            if key in value['pop_items']:
-                                num_containing_orders += 1
-                        pop_item_statistics[key] = "{}%".format((num_containing_orders * 100 / total_orders))
-
-                    self.outputs["District identifier"] = "({}, {})".format(self.warehouse_id, self.district_id)
-                    self.outputs["Number of last orders examined"] = total_orders
-                    self.outputs["Orders with popular items"] = order_map
-                    self.outputs['Popular item statistics'] = pop_item_statistics
+    def execute(self, curs):
+        statements.execute(curs, "SELECT d_next_o_id FROM district WHERE d_w_id = %s AND d_id = %s;",
+                           (self.warehouse_id, self.district_id), label="read_district")
+        next_order_id = curs.fetchone()[0]
+        first_order_id = next_order_id - self.num_last_orders
+
+        # Only fetch the orders with popular items that are not in the cached window
+        key = (self.warehouse_id, self.district_id)
+        order_map, fetch_from = order_window_cache.get(key, first_order_id, next_order_id)
+        if fetch_from < next_order_id:
+            statements.execute(curs, queries.registry.get("popular-item"), {
+                "input_warehouse_id": self.warehouse_id,
+                "input_district_id": self.district_id,
+                "input_first_order_id": fetch_from,
+                "input_next_order_id": next_order_id
+            }, label="popular_items")
+            for order_id, order_entry_date, c_first, c_middle, c_last, item_name, quantity in curs.fetchall():
+                if order_id not in order_map:
+                    order_map[order_id] = {
+                        "order_id": order_id,
+                        "order_entry_date": order_entry_date,
+                        "c_first": c_first,
+                        "c_middle": c_middle,
+                        "c_last": c_last,
+                        "pop_items": {}
+                    }
+                order_map[order_id]['pop_items'][item_name] = quantity
+            order_window_cache.put(key, first_order_id, next_order_id, order_map)
+
+        # Percentage of orders that contain each popular item, counted in a single pass over the orders
+        total_orders = len(order_map)
+        containing_orders = Counter(item_name for order in order_map.values() for item_name in order['pop_items'])
+        pop_item_statistics = {item_name: "{}%".format(count * 100 / total_orders)
+                               for item_name, count in containing_orders.items()}
+
+        self.outputs["District identifier"] = "({}, {})".format(self.warehouse_id, self.district_id)
+        self.outputs["Number of last orders examined"] = total_orders
+        self.outputs["Orders with popular items"] = dict(sorted(order_map.items()))
+        self.outputs['Popular item statistics'] = pop_item_statistics
 
 
 class TopBalanceTransaction(Transaction):
+    savepoint_retry = False
+    read_only = True
+
     def __init__(self, conn, inputs):
         super().__init__()
         self.conn = conn
 
-    def run(self):
-        with self.conn:
-            with self.conn.cursor() as curs:
-                with open('top-balance.sql', 'r') as f:
-                    top_balance_query = f.read()
-                    curs.execute(top_balance_query, {
-                        "current_timestamp": datetime.utcnow() - timedelta(seconds=1)
-                    })
-                    customers_top_balance = curs.fetchall()
+    def execute(self, curs):
+        statements.execute(curs, queries.registry.get("top-balance"), {
+            "current_timestamp": datetime.utcnow() - timedelta(seconds=1)
+        }, label="top_balance")
+        customers_top_balance = curs.fetchall()
 
-                    # Add to outputs
-                    self.outputs["Top 10 customers with highest balance"] = [
-                        "({}, {}, {}, {}, {}, {})".format(*x) for x in customers_top_balance]
+        # Add to outputs
+        self.outputs["Top 10 customers with highest balance"] = [
+            "({}, {}, {}, {}, {}, {})".format(*x) for x in customers_top_balance]
 
 
 class RelatedCustomerTransaction(Transaction):
+    savepoint_retry = False
+    read_only = True
+
     def __init__(self, conn, inputs):
         super().__init__()
         self.conn = conn
@@ -513,23 +512,18 @@ class RelatedCustomerTransaction(Transaction):
         self.district_id = int(inputs[1])
         self.customer_id = int(inputs[2])
 
-    def run(self):
-        with self.conn:
-            with self.conn.cursor() as curs:
-                with open('related-customer.sql', 'r') as f:
-                    related_customer_query = f.read()
-
-                    curs.execute(related_customer_query, {
-                        "input_warehouse_id": self.warehouse_id,
-                        "input_customer_id": self.customer_id,
-                        "input_district_id": self.district_id,
-                        "current_timestamp": datetime.utcnow() - timedelta(seconds=1)
-                    })
-                    related_customers = curs.fetchall()
-
-                    # Add to outputs
-                    self.outputs["Input customer identifier"] = "({}, {}, {})".format(self.warehouse_id,
-                                                                                      self.district_id,
-                                                                                      self.customer_id)
-                    self.outputs['Related customers'] = [
-                        "({}, {}, {})".format(*x) for x in related_customers]
+    def execute(self, curs):
+        statements.execute(curs, queries.registry.get("related-customer"), {
+            "input_warehouse_id": self.warehouse_id,
+            "input_customer_id": self.customer_id,
+            "input_district_id": self.district_id,
+            "current_timestamp": datetime.utcnow() - timedelta(seconds=1)
+        }, label="related_customers")
+        related_customers = curs.fetchall()
+
+        # Add to outputs
+        self.outputs["Input customer identifier"] = "({}, {}, {})".format(self.warehouse_id,
+                                                                          self.district_id,
+                                                                          self.customer_id)
+        self.outputs['Related customers'] = [
+            "({}, {}, {})".format(*x) for x in related_customers]